@@ -0,0 +1,85 @@
+import re
+from .config import COMMAND_PACING, MAX_EXPANDED_COMMANDS
+
+ALIAS_MAX_DEPTH = 5     # Aliases may refer to other aliases this deep
+ALIAS_NAME_RE = re.compile(r'^[^\s;#]+$')
+
+# A run of counted directions such as .4n2e3s or .2nw; the prefix keeps words
+# like "2nd" or "news" from being read as directions
+SPEEDWALK_RE = re.compile(r'^\.((?:\d*(?:ne|nw|se|sw|n|s|e|w|u|d))+)$', re.IGNORECASE)
+SPEEDWALK_STEP_RE = re.compile(r'(\d*)(ne|nw|se|sw|n|s|e|w|u|d)', re.IGNORECASE)
+
+# "#3 kill rat" repeats a command
+REPEAT_RE = re.compile(r'^#(\d+)\s+(.*)$')
+
+# $1..$9 and $* in alias bodies
+ALIAS_ARG_RE = re.compile(r'\$(\d|\*)')
+
+class AliasExpander:
+    """
+    Per-user aliases, speedwalks and repeats.
+    One line of input expands into a list of MUD commands that the caller
+    sends together, so a single Discord message costs a single write.
+    """
+    def __init__(self):
+        self.aliases = {}
+        self.pacing = COMMAND_PACING
+
+    def add(self, name, body):
+        if not ALIAS_NAME_RE.match(name):
+            raise ValueError("Alias names can't contain spaces, ';' or '#'")
+        if not body:
+            raise ValueError("Alias body can't be empty")
+        self.aliases[name.lower()] = body
+
+    def remove(self, name):
+        return self.aliases.pop(name.lower(), None)
+
+    def expand(self, text):
+        """Returns the MUD commands for a block of input, one per line."""
+        commands = []
+        for line in text.split('\n'):
+            self._expand_line(line, commands, 0)
+        return commands
+
+    def _expand_line(self, line, commands, depth):
+        stripped = line.strip()
+
+        match = REPEAT_RE.match(stripped)
+        if match:
+            count = int(match.group(1))
+            self._check_size(commands, count)
+            for _ in range(count):
+                self._expand_line(match.group(2), commands, depth)
+            return
+
+        match = SPEEDWALK_RE.match(stripped)
+        if match:
+            for count, direction in SPEEDWALK_STEP_RE.findall(match.group(1)):
+                count = int(count or 1)
+                # Check before building the list so a huge count can't stall the loop
+                self._check_size(commands, count)
+                commands.extend([direction.lower()] * count)
+            return
+
+        name, _, rest = stripped.partition(' ')
+        body = self.aliases.get(name.lower())
+        if body is not None and depth < ALIAS_MAX_DEPTH:
+            args = rest.split()
+            def substitute(m):
+                if m.group(1) == '*':
+                    return rest
+                index = int(m.group(1)) - 1
+                return args[index] if 0 <= index < len(args) else ""
+            for part in ALIAS_ARG_RE.sub(substitute, body).split(';'):
+                self._expand_line(part, commands, depth + 1)
+            return
+
+        # Plain command: typed lines keep their original spacing
+        self._check_size(commands, 1)
+        commands.append(line if depth == 0 else stripped)
+
+    def _check_size(self, commands, adding=0):
+        """Raises ValueError if commands (plus adding more) exceeds the cap."""
+        if adding > MAX_EXPANDED_COMMANDS - len(commands):
+            raise ValueError(f"Input expands to more than {MAX_EXPANDED_COMMANDS} commands")
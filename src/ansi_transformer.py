@@ -1,5 +1,6 @@
 import re
 import colorsys
+from functools import lru_cache
 
 # --- Constants ---
 
@@ -57,6 +58,9 @@ COLOR_MODE_24BIT = 2
 WHITE_THRESHOLD = 200
 SATURATION_FACTOR = 10.0
 
+# Number of distinct 24-bit colors remembered per process
+RGB_CACHE_SIZE = 4096
+
 # --- Helper Functions ---
 
 def get_xterm_256_palette():
@@ -114,6 +118,24 @@ def get_closest_ansi(rgb, palette_dict):
             best_code = code
     return best_code
 
+def map_rgb_to_discord(rgb, is_bg):
+    """Converts an RGB color to the closest Discord-compatible ANSI code."""
+    r, g, b = rgb
+    # White detection threshold bypasses saturation adjustment
+    if r > WHITE_THRESHOLD and g > WHITE_THRESHOLD and b > WHITE_THRESHOLD:
+        return 47 if is_bg else 37
+
+    rgb = adjust_saturation(rgb)
+    palette = DISCORD_BG if is_bg else DISCORD_FG
+    return get_closest_ansi(rgb, palette)
+
+# Discord codes for every xterm 256-color index, computed once at import
+XTERM_256_FG = [map_rgb_to_discord(rgb, False) for rgb in XTERM_256_PALETTE]
+XTERM_256_BG = [map_rgb_to_discord(rgb, True) for rgb in XTERM_256_PALETTE]
+
+# Truecolor MUDs tend to reuse a small set of colors, so remember recent ones
+cached_map_rgb_to_discord = lru_cache(maxsize=RGB_CACHE_SIZE)(map_rgb_to_discord)
+
 # --- Core Logic ---
 
 class SGRState:
@@ -127,6 +149,12 @@ class SGRState:
         self.fg = None
         self.bg = None
 
+    def __eq__(self, other):
+        return (self.bold == other.bold and
+                self.underline == other.underline and
+                self.fg == other.fg and
+                self.bg == other.bg)
+
     def copy(self):
         new_state = SGRState()
         new_state.bold = self.bold
@@ -162,9 +190,14 @@ class SGRState:
                 self.bg = self.normalize_4bit_color(p - 100, is_bg=True)
             elif p == SGR_FG_EXTENDED or p == SGR_BG_EXTENDED:
                 is_bg = (p == SGR_BG_EXTENDED)
-                # Direct mapping for 8-bit color palette (0-7) to match 4-bit colors
-                if i + 2 < len(params) and params[i+1] == COLOR_MODE_8BIT and params[i+2] < 8:
-                    color = self.normalize_4bit_color(params[i+2], is_bg)
+                if i + 2 < len(params) and params[i+1] == COLOR_MODE_8BIT:
+                    color_idx = params[i+2]
+                    if color_idx < 8:
+                        # Direct mapping for 8-bit color palette (0-7) to match 4-bit colors
+                        color = self.normalize_4bit_color(color_idx, is_bg)
+                    else:
+                        table = XTERM_256_BG if is_bg else XTERM_256_FG
+                        color = table[color_idx % 256]
                     if is_bg: self.bg = color
                     else: self.fg = color
                     i += 2
@@ -217,14 +250,7 @@ class SGRState:
 
     def process_rgb(self, rgb, is_bg):
         """Converts an RGB color to the closest Discord-compatible ANSI code."""
-        r, g, b = rgb
-        # White detection threshold bypasses saturation adjustment
-        if r > WHITE_THRESHOLD and g > WHITE_THRESHOLD and b > WHITE_THRESHOLD:
-            return 47 if is_bg else 37
-
-        rgb = adjust_saturation(rgb)
-        palette = DISCORD_BG if is_bg else DISCORD_FG
-        return get_closest_ansi(rgb, palette)
+        return cached_map_rgb_to_discord(rgb, is_bg)
 
     def get_sequence(self, prev_state=None, explicit_reset=False):
         """Constructs a Discord-compatible ANSI sequence representing the current state."""
@@ -291,42 +317,50 @@ def parse_sgr_params(param_str):
 # Regex for ANSI SGR: ESC [ parameters m
 ANSI_SGR_RE = re.compile(r'\x1b\[([\d;:]*)m')
 
+class AnsiTransformer:
+    """
+    Incrementally transforms ANSI-coded text into Discord-compatible formatting.
+    SGR state is kept across feed() calls, so one instance should be used per
+    connection. Sequences are only emitted when text follows them and the state
+    actually differs from what was last emitted.
+    """
+    def __init__(self):
+        self.state = SGRState()
+        self.emitted_state = SGRState()
+
+    def feed(self, text: str) -> str:
+        """Transforms a segment that may contain SGR sequences."""
+        result = []
+        last_end = 0
+        for match in ANSI_SGR_RE.finditer(text):
+            self._append_text(result, text[last_end:match.start()])
+            self.state.apply_params(parse_sgr_params(match.group(1)))
+            last_end = match.end()
+        self._append_text(result, text[last_end:])
+        return "".join(result)
+
+    def feed_text(self, text: str) -> str:
+        """Transforms a segment known to contain no SGR sequences."""
+        result = []
+        self._append_text(result, text)
+        return "".join(result)
+
+    def flush(self) -> str:
+        """Returns the sequence for any state change not yet emitted."""
+        if self.state == self.emitted_state:
+            return ""
+        seq = self.state.get_sequence(prev_state=self.emitted_state)
+        self.emitted_state = self.state.copy()
+        return seq
+
+    def _append_text(self, result, text):
+        if not text:
+            return
+        if self.state != self.emitted_state:
+            result.append(self.flush())
+        result.append(text)
+
 def transform_ansi_to_discord(text: str) -> str:
     """Transforms a stream of ANSI-coded text into Discord-compatible formatting."""
-    result = []
-    last_end = 0
-    state = SGRState()
-    prev_emitted_state = SGRState()
-
-    for match in ANSI_SGR_RE.finditer(text):
-        # Add plain text segment before the escape sequence
-        result.append(text[last_end:match.start()])
-
-        param_str = match.group(1)
-        params = parse_sgr_params(param_str)
-
-        # Apply the parameters to our internal state
-        explicit_reset = state.apply_params(params)
-
-        # Generate the optimized Discord-compatible sequence
-        seq = state.get_sequence(prev_state=prev_emitted_state, explicit_reset=explicit_reset)
-        if seq:
-            # Check if this sequence is effectively a no-op reset
-            is_redundant_reset = (
-                seq == f"\x1b[{SGR_RESET}m" and
-                not prev_emitted_state.bold and
-                not prev_emitted_state.underline and
-                prev_emitted_state.fg is None and
-                prev_emitted_state.bg is None and
-                not explicit_reset
-            )
-
-            if not is_redundant_reset:
-                result.append(seq)
-                prev_emitted_state = state.copy()
-
-        last_end = match.end()
-
-    # Add trailing plain text
-    result.append(text[last_end:])
-    return "".join(result)
+    transformer = AnsiTransformer()
+    return transformer.feed(text) + transformer.flush()
@@ -1,15 +1,17 @@
 import discord
 from discord.ext import commands
 import asyncio
+import os
 import socket
 import signal
 from datetime import datetime
-from .config import MUD_HOST, MUD_PORT, MUD_SCHEME, MUD_PATH, MAX_INPUT_LENGTH, MAX_BUFFER_SIZE, ANSI_TIMEOUT
+from .config import MUD_HOST, MUD_PORT, MUD_SCHEME, MUD_PATH, HANDOFF_SOCKET, MAX_INPUT_LENGTH, ANSI_TIMEOUT, READ_SIZE_MIN, READ_SIZE_MAX, TRIGGER_HOLD_TIMEOUT
 from .protocol import Telnet, DecompressionError
 from .session import MudSession, SessionManager
 from .commands import MudCommands
 from .utils import parse_mud_url
 from .connection import connect_mud
+from .handoff import bind_handoff_socket, serve_handoff, request_handoff, transfer_blocker, export_session, import_session, export_user, import_user, send_records, unread_bytes, HandoffUnconfirmed
 
 class DiscordMudClient(commands.Bot):
     def __init__(self, *args, **kwargs):
@@ -18,9 +20,18 @@ class DiscordMudClient(commands.Bot):
         super().__init__(command_prefix='\x00', help_command=None, *args, **kwargs)
         self.session_manager = SessionManager(self)
         self.is_shutting_down = False
+        self.handing_off = False
+        self.handoff_task = None
 
     async def setup_hook(self):
         await self.add_cog(MudCommands(self))
+        if HANDOFF_SOCKET:
+            # Take over a previous process's sessions before handling any events.
+            # Raises if a running process answered but the transfer failed, so
+            # we don't serve DMs alongside it.
+            await self.receive_handoff()
+            listener = bind_handoff_socket(HANDOFF_SOCKET)
+            self.handoff_task = asyncio.create_task(serve_handoff(listener, self.hand_off))
         try:
             # Sync commands globally. Slash commands can take time to propagate in guilds,
             # but usually appear instantly in DMs.
@@ -49,22 +60,155 @@ class DiscordMudClient(commands.Bot):
         if self.is_shutting_down: return
         self.is_shutting_down = True
         self.log_event("SYSTEM", "CORE", "Shutdown signal received. Closing all sessions...")
+        await self._close_all_sessions(lambda session: "🛑 **Bot Shutdown:** Bridge closing. Your session has ended.")
+        self.session_manager.stop()
+        await self.close()
 
+    async def _close_all_sessions(self, notice):
         uids = list(self.session_manager.sessions.keys())
 
         async def notify_and_close(uid):
             session = self.session_manager.get(uid)
             if session:
                 try:
-                    await session.channel.send("🛑 **Bot Shutdown:** Bridge closing. Your session has ended.")
+                    await session.channel.send(notice(session))
                 except: pass
                 await self.session_manager.close_session(uid)
 
         if uids:
             await asyncio.gather(*(notify_and_close(uid) for uid in uids), return_exceptions=True)
 
+    async def hand_off(self, conn):
+        """
+        Passes every MUD connection that can move to a newly started process,
+        then shuts down. Sessions on TLS, MCCP or websockets are listed for the
+        new process to reconnect instead.
+        """
+        if self.is_shutting_down:
+            if self.handing_off:
+                # Another process is taking over; make this one abort its startup
+                conn.close()
+            else:
+                # Exiting anyway, so there is nothing to adopt
+                try:
+                    await asyncio.to_thread(send_records, conn, [({'type': 'end'}, None)])
+                except Exception:
+                    pass
+                finally:
+                    conn.close()
+            return
+        self.is_shutting_down = True
+        self.handing_off = True
+        self.log_event("SYSTEM", "CORE", "Hot restart requested. Handing off sessions...")
+        manager = self.session_manager
+
+        records = [(export_user(manager, uid), None) for uid in set(manager.aliases) | set(manager.triggers)]
+        moved = []
+        reasons = {}
+        sessions = list(manager.sessions.values())
+        # Detach everything at once, so flushing takes at most one
+        # HANDOFF_FLUSH_TIMEOUT however many sessions there are
+        blockers = {session: transfer_blocker(session) for session in sessions}
+        movable = [session for session in sessions if blockers[session] is None]
+        flushed = await asyncio.gather(*(session.detach() for session in movable))
+        detached = {session for session, ok in zip(movable, flushed) if ok}
+        for session in sessions:
+            if session in detached:
+                # Bytes asyncio already read from the socket but the listener hasn't parsed
+                unread = unread_bytes(session.reader)
+                records.append((export_session(session, unread), session.writer.get_extra_info('socket').fileno()))
+                moved.append(session)
+                continue
+            reason = blockers[session]
+            if reason is None:
+                session.resume()
+                reason = "pending writes"
+            reasons[session.user_id] = reason
+            records.append(({'type': 'reconnect', 'user_id': session.user_id, 'channel_id': session.channel.id, 'url': session.url, 'reason': reason}, None))
+        records.append(({'type': 'end'}, None))
+
+        try:
+            await asyncio.to_thread(send_records, conn, records)
+        except HandoffUnconfirmed as e:
+            # The new process may already be running our sessions; resuming
+            # them here could leave two bots answering every DM
+            self.log_event("SYSTEM", "CORE", f"Handoff not confirmed, shutting down anyway: {e}")
+        except Exception as e:
+            # The new process aborts its startup when a transfer fails
+            self.log_event("SYSTEM", "CORE", f"Handoff failed, keeping sessions: {e}")
+            for session in moved:
+                session.resume()
+            self.is_shutting_down = False
+            self.handing_off = False
+            return
+        finally:
+            conn.close()
+
+        for session in moved:
+            # The new process holds its own copy of the socket, so this sends nothing
+            session.protocol.close()
+            session.writer.transport.abort()
+        self.log_event("SYSTEM", "CORE", f"Handed off {len(moved)} sessions; {len(reasons)} will reconnect.")
+
+        await self._close_all_sessions(lambda session: f"🔄 **Bot Restarting:** Your {reasons.get(session.user_id, 'connection')} session can't be carried over, so you'll be reconnected.")
+        self.session_manager.stop()
         await self.close()
 
+    async def receive_handoff(self):
+        """
+        Adopts the sessions of a previous process, if one is listening.
+        Raises if it answered but the transfer failed, since it then keeps
+        its sessions and stays up.
+        """
+        try:
+            records = await request_handoff(HANDOFF_SOCKET)
+        except Exception as e:
+            self.log_event("SYSTEM", "CORE", f"Failed to receive handoff, not starting: {e}")
+            raise
+        if not records:
+            return
+
+        adopted = 0
+        for record, fd in records:
+            try:
+                if record['type'] == 'user':
+                    import_user(self.session_manager, record)
+                elif record['type'] == 'session':
+                    sock = socket.socket(fileno=fd)
+                    fd = None
+                    await self.adopt_session(record, sock)
+                    adopted += 1
+                elif record['type'] == 'reconnect':
+                    asyncio.create_task(self.reconnect_session(record))
+            except Exception as e:
+                self.log_event(record.get('user_id', "SYSTEM"), "CORE", f"Failed to adopt handed-off {record['type']}: {e}")
+                if fd is not None:
+                    os.close(fd)
+        self.log_event("SYSTEM", "CORE", f"Adopted {adopted} sessions from the previous process.")
+
+    async def adopt_session(self, state, sock):
+        user_id = state['user_id']
+        username = state['username']
+        try:
+            channel = self.get_channel(state['channel_id']) or await self.fetch_channel(state['channel_id'])
+            reader, writer = await asyncio.open_connection(sock=sock)
+        except Exception:
+            sock.close()
+            raise
+        session = MudSession(self.session_manager, user_id, reader, writer, channel, username)
+        import_session(session, state)
+        self.session_manager.sessions[user_id] = session
+        session.listener_task = asyncio.create_task(self.mud_listener(user_id, channel, username))
+        if session.buffer:
+            await session.msg_queue.put(True)
+        self.log_event(user_id, username, "Adopted session from the previous process.")
+
+    async def reconnect_session(self, state):
+        user = await self.fetch_user(state['user_id'])
+        channel = self.get_channel(state['channel_id']) or await self.fetch_channel(state['channel_id'])
+        self.log_event(user.id, str(user), f"Reconnecting after restart ({state['reason']} session).")
+        await self.init_session(user, channel, state['url'])
+
     async def close_session(self, user_id):
         """Helper to close session via manager."""
         await self.session_manager.close_session(user_id)
@@ -72,19 +216,45 @@ class DiscordMudClient(commands.Bot):
     async def mud_listener(self, user_id, channel, username):
         session = self.session_manager.get(user_id)
         if not session: return
+        read_size = 8192
         try:
             while True:
-                data = await session.reader.read(8192)
+                # Stop reading while Discord is behind so TCP flow control
+                # pushes back on the MUD instead of dropping game text.
+                await session.wait_for_drain()
+
+                if session.triggers.holding:
+                    # A gag or highlight may still apply to a held line; give it
+                    # a moment to finish before treating it as a prompt.
+                    try:
+                        data = await asyncio.wait_for(session.reader.read(read_size), timeout=TRIGGER_HOLD_TIMEOUT)
+                    except asyncio.TimeoutError:
+                        await self._deliver_output(session, *session.triggers.flush())
+                        continue
+                else:
+                    data = await session.reader.read(read_size)
                 if not data:
                     self.log_event(user_id, username, "Connection closed by remote MUD host.")
                     break
 
+                # Grow reads while the MUD fills them, shrink when it trickles
+                if len(data) >= read_size:
+                    read_size = min(read_size * 2, READ_SIZE_MAX)
+                elif len(data) < read_size // 4:
+                    read_size = max(read_size // 2, READ_SIZE_MIN)
+
                 try:
-                    raw_text = session.protocol.feed(data)
-                    if raw_text or getattr(session, 'bell_pending', False):
-                        if raw_text:
-                            session.buffer = (session.buffer + raw_text)[-MAX_BUFFER_SIZE:]
-                        await session.msg_queue.put(True)
+                    if isinstance(data, str):
+                        # Websocket text frame, already decoded
+                        raw_text = session.protocol.feed_text(data)
+                    else:
+                        raw_text = session.protocol.feed(data)
+                    if session.minimizer:
+                        raw_text = session.minimizer.process(raw_text)
+                    commands = ()
+                    if session.triggers or session.triggers.holding:
+                        raw_text, commands = session.triggers.process(raw_text, session.protocol.at_prompt)
+                    await self._deliver_output(session, raw_text, commands)
                 except DecompressionError as e:
                     self.log_event(user_id, username, f"Decompression error: {e}")
                     try:
@@ -105,6 +275,16 @@ class DiscordMudClient(commands.Bot):
                 except: pass
             await self.session_manager.close_session(user_id)
 
+    async def _deliver_output(self, session, text, commands):
+        """Queues processed MUD output for Discord and trigger commands for the MUD."""
+        if commands:
+            # The writer task batches these with anything else being sent
+            session.protocol.queue_text("".join(c + "\n" for c in commands))
+        if text or session.bell_pending:
+            if text:
+                session.buffer.append(text)
+            await session.msg_queue.put(True)
+
     async def init_session(self, user, channel, url=None):
         user_id = user.id
         display_name = str(user)
@@ -143,6 +323,7 @@ class DiscordMudClient(commands.Bot):
         try:
             reader, writer = await connect_mud(protocol, host, port, path, on_warning=on_warning)
             session = MudSession(self.session_manager, user_id, reader, writer, channel, display_name)
+            session.url = conn_display
             self.session_manager.sessions[user_id] = session
 
             # Check for encryption
@@ -157,13 +338,16 @@ class DiscordMudClient(commands.Bot):
 
             self.log_event(user_id, display_name, f"Successfully connected to MUD (Encrypted: {is_encrypted}).")
 
-            await session.protocol.send_command(Telnet.WILL, Telnet.TTYPE)
-            await session.protocol.send_command(Telnet.WILL, Telnet.NAWS)
+            session.protocol.queue_command(Telnet.WILL, Telnet.TTYPE)
+            session.protocol.queue_command(Telnet.WILL, Telnet.NAWS)
             await session.protocol.send_naws()
 
             session.listener_task = asyncio.create_task(self.mud_listener(user_id, channel, display_name))
             self.session_manager.stop_connecting(user_id)
 
+        except asyncio.CancelledError:
+            self.session_manager.stop_connecting(user_id)
+            raise
         except Exception as e:
             self.session_manager.stop_connecting(user_id)
             self.log_event(user_id, display_name, f"Connection failed: {str(e)}")
@@ -179,7 +363,22 @@ class DiscordMudClient(commands.Bot):
         # protocol.send_text calls safe_send which already handles logging
         # and closing the session on network errors.
         try:
-            await session.protocol.send_text(content + "\n")
+            if session.echo_off:
+                # Never expand aliases in a password
+                await session.protocol.send_text(content + "\n")
+            else:
+                try:
+                    commands = session.aliases.expand(content)
+                except ValueError as e:
+                    await message.channel.send(f"❌ {str(e)}")
+                    return
+                if session.minimizer:
+                    session.minimizer.note_commands(commands)
+                async with session.input_lock:
+                    await session.protocol.send_lines(commands, pacing=session.aliases.pacing)
+        except ConnectionError:
+            # The session closed mid-send; close_session has already cleaned up
+            return
         except (UnicodeEncodeError, ValueError) as e:
             # Specific processing errors (e.g. encoding issues) should be logged
             # but don't necessarily require closing the entire session.
@@ -2,8 +2,11 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 import asyncio
-from .config import MAX_INPUT_LENGTH, ANSI_TIMEOUT
+import re
+from .config import MAX_INPUT_LENGTH, ANSI_TIMEOUT, UPLOAD_LINES_PER_SECOND
 from .protocol import NAWS_MIN, NAWS_MAX
+from .triggers import Trigger
+from .upload import Upload
 
 class MudCommands(commands.Cog):
     def __init__(self, bot):
@@ -85,6 +88,8 @@ class MudCommands(commands.Cog):
         session = self.bot.session_manager.get(user_id)
         if session:
             try:
+                if session.minimizer:
+                    session.minimizer.note_commands([""])
                 await session.protocol.send_text("\n")
                 await interaction.response.send_message("✅ *Newline sent.*", ephemeral=True)
             except:
@@ -143,3 +148,141 @@ class MudCommands(commands.Cog):
                 await interaction.response.send_message("❌ Connection error while sending data.", ephemeral=True)
         else:
             await interaction.response.send_message("❌ You are not currently connected.", ephemeral=True)
+
+    @app_commands.command(name="trigger", description="Gag, highlight or respond to MUD output lines")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(action="What to do with matching lines", pattern="Text (or regex) to look for", command="Command to send for the send action", regex="Treat the pattern as a regular expression")
+    @app_commands.choices(action=[
+        app_commands.Choice(name="gag", value="gag"),
+        app_commands.Choice(name="highlight", value="highlight"),
+        app_commands.Choice(name="send", value="send"),
+    ])
+    async def trigger_slash(self, interaction: discord.Interaction, action: app_commands.Choice[str], pattern: str, command: str = None, regex: bool = False):
+        try:
+            trigger = Trigger(pattern, action.value, is_regex=regex, command=command)
+        except (ValueError, re.error) as e:
+            await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True)
+            return
+        self.bot.session_manager.get_triggers(interaction.user.id).add(trigger)
+        await interaction.response.send_message(f"✅ *Added trigger:* {trigger.describe()}", ephemeral=True)
+
+    @app_commands.command(name="triggers", description="List your triggers")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    async def triggers_slash(self, interaction: discord.Interaction):
+        engine = self.bot.session_manager.get_triggers(interaction.user.id)
+        if not engine:
+            await interaction.response.send_message("You have no triggers.", ephemeral=True)
+            return
+        lines = [f"{i + 1}. {t.describe()}" for i, t in enumerate(engine.triggers)]
+        await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+    @app_commands.command(name="untrigger", description="Remove a trigger by its number in /triggers")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(number="The trigger number shown by /triggers")
+    async def untrigger_slash(self, interaction: discord.Interaction, number: int):
+        engine = self.bot.session_manager.get_triggers(interaction.user.id)
+        if not 1 <= number <= len(engine.triggers):
+            await interaction.response.send_message("❌ No trigger with that number.", ephemeral=True)
+            return
+        trigger = engine.remove(number - 1)
+        await interaction.response.send_message(f"🗑️ *Removed trigger:* {trigger.describe()}", ephemeral=True)
+
+    @app_commands.command(name="alias", description="Define a command alias (use ; to separate commands, $1 or $* for arguments)")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(name="The word that triggers the alias", body="Commands to send, e.g. 'get all $1;wear all'")
+    async def alias_slash(self, interaction: discord.Interaction, name: str, body: str):
+        try:
+            self.bot.session_manager.get_aliases(interaction.user.id).add(name, body)
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True)
+            return
+        await interaction.response.send_message(f"✅ *Alias added:* `{name}` → `{body}`", ephemeral=True)
+
+    @app_commands.command(name="aliases", description="List your aliases")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    async def aliases_slash(self, interaction: discord.Interaction):
+        expander = self.bot.session_manager.get_aliases(interaction.user.id)
+        if not expander.aliases:
+            await interaction.response.send_message("You have no aliases.", ephemeral=True)
+            return
+        lines = [f"`{name}` → `{body}`" for name, body in sorted(expander.aliases.items())]
+        await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+    @app_commands.command(name="unalias", description="Remove an alias")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(name="The alias to remove")
+    async def unalias_slash(self, interaction: discord.Interaction, name: str):
+        if self.bot.session_manager.get_aliases(interaction.user.id).remove(name) is None:
+            await interaction.response.send_message("❌ No alias with that name.", ephemeral=True)
+            return
+        await interaction.response.send_message(f"🗑️ *Removed alias:* `{name}`", ephemeral=True)
+
+    @app_commands.command(name="pacing", description="Set the delay between commands expanded from one message")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(milliseconds="Delay between commands (0 sends them all at once)")
+    async def pacing_slash(self, interaction: discord.Interaction, milliseconds: app_commands.Range[int, 0, 5000]):
+        self.bot.session_manager.get_aliases(interaction.user.id).pacing = milliseconds / 1000
+        await interaction.response.send_message(f"⏱️ *Command pacing set to {milliseconds}ms.*", ephemeral=True)
+
+    @app_commands.command(name="upload", description="Send a text file to the MUD line by line")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.describe(file="The text file to send", lines_per_second="Lines sent per second (0 for as fast as the MUD accepts)")
+    async def upload_slash(self, interaction: discord.Interaction, file: discord.Attachment, lines_per_second: app_commands.Range[int, 0, 100] = UPLOAD_LINES_PER_SECOND):
+        session = self.bot.session_manager.get(interaction.user.id)
+        if not session:
+            await interaction.response.send_message("❌ You are not currently connected.", ephemeral=True)
+            return
+        if session.upload_task and not session.upload_task.done():
+            await interaction.response.send_message("❌ An upload is already running. Use `/cancelupload` to stop it.", ephemeral=True)
+            return
+        if not self.bot._is_text_attachment(file):
+            await interaction.response.send_message("❌ Only text files can be uploaded.", ephemeral=True)
+            return
+
+        await interaction.response.send_message(f"📤 *Uploading `{file.filename}`...*")
+        upload = Upload(session, file, lines_per_second)
+
+        async def on_progress(lines_sent):
+            try:
+                await interaction.edit_original_response(content=f"📤 *Uploading `{file.filename}`... {lines_sent} lines sent*")
+            except discord.HTTPException:
+                # Progress is cosmetic; the interaction token may have expired
+                pass
+
+        async def run_upload():
+            try:
+                await upload.run(on_progress)
+                result = f"✅ *Uploaded `{file.filename}`: {upload.lines_sent} lines sent*"
+            except asyncio.CancelledError:
+                result = f"⏹️ *Upload of `{file.filename}` stopped after {upload.lines_sent} lines*"
+            except Exception as e:
+                self.bot.log_event(session.user_id, session.username, f"Upload failed: {e}")
+                result = f"❌ *Upload of `{file.filename}` failed after {upload.lines_sent} lines*"
+            try:
+                await interaction.edit_original_response(content=result)
+            except discord.HTTPException:
+                try:
+                    await session.channel.send(result)
+                except discord.HTTPException:
+                    pass
+
+        session.upload_task = asyncio.create_task(run_upload())
+
+    @app_commands.command(name="cancelupload", description="Stop a running upload")
+    @app_commands.allowed_contexts(guilds=False, dms=True, private_channels=True)
+    @app_commands.allowed_installs(guilds=True, users=True)
+    async def cancelupload_slash(self, interaction: discord.Interaction):
+        session = self.bot.session_manager.get(interaction.user.id)
+        if not session or not session.upload_task or session.upload_task.done():
+            await interaction.response.send_message("❌ No upload is running.", ephemeral=True)
+            return
+        session.upload_task.cancel()
+        await interaction.response.send_message("⏹️ *Stopping upload.*", ephemeral=True)
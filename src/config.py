@@ -8,10 +8,52 @@ MUD_HOST = os.getenv('MUD_HOST', 'mume.org')
 MUD_PORT = os.getenv('MUD_PORT', '4242')
 MUD_SCHEME = os.getenv('MUD_SCHEME', 'telnets').lower() # 'telnet', 'telnets', 'ws', 'wss'
 MUD_PATH = os.getenv('MUD_PATH', '/')
+WS_COMPRESSION = os.getenv('WS_COMPRESSION', 'deflate').lower() # 'deflate' or 'none' for ws/wss MUDs
+HANDOFF_SOCKET = os.getenv('HANDOFF_SOCKET', '') # Unix socket path for hot restarts; empty disables them
 TRANSLITERATE = os.getenv('TRANSLITERATE', 'True').lower() == 'true'
+MINIMIZE_OUTPUT = os.getenv('MINIMIZE_OUTPUT', 'False').lower() == 'true' # Strip characters that don't change the output
+TLS_RACE_LENIENT = os.getenv('TLS_RACE_LENIENT', 'False').lower() == 'true' # Try unverified TLS alongside verified TLS
+EDIT_APPEND = os.getenv('EDIT_APPEND', 'False').lower() == 'true' # Grow the last message instead of posting new ones
 
 # Constants
-MAX_BUFFER_SIZE = 50000  # Prevent memory exhaustion
+MAX_BUFFER_SIZE = 50000  # Pending output at which we stop reading from the MUD
+BUFFER_LOW_WATER = 20000 # Pending output at which reading resumes
+READ_SIZE_MIN = 1024     # Bounds for the adaptive MUD read size
+READ_SIZE_MAX = 65536
 MAX_INPUT_LENGTH = 500   # Prevent MUD buffer flooding
+TRIGGER_HOLD_TIMEOUT = 0.3 # Max time an unterminated line waits for gag/highlight triggers
+TRIGGER_REFIRE_INTERVAL = 1.0 # Min seconds between two firings of the same send trigger
+MAX_EXPANDED_COMMANDS = 100 # Max commands one input may expand to via aliases
+COMMAND_PACING = 0.0     # Default seconds between expanded commands (0 sends them in one write)
 ANSI_TIMEOUT = 2.0       # Timeout for network write/drain operations
 SESSION_CLOSE_TIMEOUT = 2.0
+GMCP_PING_INTERVAL = 45.0 # Idle time after which GMCP sessions are sent Core.Ping
+HEARTBEAT_TICK = 1.0     # Resolution of the shared idle-session timer wheel
+HEARTBEAT_SLOTS = 64     # Timer wheel buckets; one turn must cover GMCP_PING_INTERVAL
+HANDOFF_TIMEOUT = 10.0   # Max time to pass sessions to a restarted process
+HANDOFF_FLUSH_TIMEOUT = 2.0 # Max time to flush writes before handing sessions off; keep well below HANDOFF_TIMEOUT
+WS_READ_AHEAD = 32       # Websocket frames received ahead of the reader
+WS_DEFLATE_WINDOW_BITS = None # permessage-deflate window (9-15) to request; None keeps the default of 15
+WS_DEFLATE_MEM_LEVEL = 5 # zlib memLevel (1-9) for permessage-deflate
+CONNECT_TIMEOUT = 15.0   # Overall deadline for connecting to a MUD
+HAPPY_EYEBALLS_DELAY = 0.25 # Stagger between connection attempts to different addresses
+DNS_CACHE_TTL = 300.0    # Seconds a MUD host lookup is reused
+CONNECTION_CACHE_SIZE = 256 # Max hosts kept in the DNS and TLS session caches
+CHANNEL_RATE_LIMIT = 5   # Messages per CHANNEL_RATE_PERIOD, Discord's per-channel bucket
+CHANNEL_RATE_PERIOD = 5.0
+GLOBAL_RATE_LIMIT = 50   # Requests per GLOBAL_RATE_PERIOD across the whole bot
+GLOBAL_RATE_PERIOD = 1.0
+INTERACTIVE_SEND_WEIGHT = 2 # Global send share of sessions with under FLUSH_SIZE pending, relative to ones sending a backlog
+EDIT_APPEND_MAX_AGE = 60.0 # Only messages younger than this are extended
+EDIT_INTERVAL = 1.0      # Min time between edits of the same message
+SPILL_THRESHOLD = 10000  # Backlog above which output is sent as one attachment
+SPILL_TAIL_LINES = 10    # Lines of a spilled backlog also shown inline
+FLUSH_DEADLINE = 0.05    # Max time to batch MUD output before sending
+FLUSH_SIZE = 1800        # Pending output that is sent without waiting for the deadline
+UPLOAD_CHUNK_SIZE = 16384        # Bytes read from an /upload attachment at a time
+UPLOAD_MAX_LINE = 4096           # Longer uploaded lines are split
+UPLOAD_LINES_PER_SECOND = 10     # Default /upload pacing
+UPLOAD_PROGRESS_INTERVAL = 2.0   # Min seconds between /upload progress updates
+MAX_SUBNEGOTIATION_SIZE = 65536  # Larger SB payloads (e.g. GMCP) are discarded
+MCCP_CHUNK_SIZE = 16384          # Max bytes inflated per decompress() call
+MCCP_MAX_EXPANSION = 4 * 1024 * 1024  # Max bytes inflated from a single read
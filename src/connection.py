@@ -1,28 +1,80 @@
 import asyncio
+import functools
 import socket
 import ssl
+import time
+from collections import deque
 import websockets
+from websockets.extensions.permessage_deflate import ClientPerMessageDeflateFactory
+from .config import DNS_CACHE_TTL, CONNECTION_CACHE_SIZE, CONNECT_TIMEOUT, HAPPY_EYEBALLS_DELAY, TLS_RACE_LENIENT, WS_READ_AHEAD, WS_COMPRESSION, WS_DEFLATE_WINDOW_BITS, WS_DEFLATE_MEM_LEVEL
 
 class WebSocketStreamAdapter:
+    """
+    Presents a websocket as a reader/writer pair.
+    A background task reads up to WS_READ_AHEAD frames ahead. read() hands
+    frames back whole, so binary frames are never copied or re-sliced, and
+    joins small queued frames so a burst costs one protocol feed.
+    Text frames are returned as str and skip the encode/decode round trip.
+    """
     def __init__(self, websocket):
         self.ws = websocket
-        self._read_buffer = bytearray()
+        self._frames = deque()
+        self._frame_ready = asyncio.Event()
+        self._space_ready = asyncio.Event()
+        self._recv_task = None
+        self._closed = False
+        self._error = None
         self._write_buffer = bytearray()
 
+    async def _recv_loop(self):
+        try:
+            while True:
+                if len(self._frames) >= WS_READ_AHEAD:
+                    # Let websocket and TCP flow control push back on the MUD
+                    self._space_ready.clear()
+                    await self._space_ready.wait()
+                    continue
+                self._frames.append(await self.ws.recv())
+                self._frame_ready.set()
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        except Exception as e:
+            # Hand anything else to the reader so the listener logs it
+            self._error = e
+        finally:
+            self._closed = True
+            self._frame_ready.set()
+
     async def read(self, n):
-        if not self._read_buffer:
-            try:
-                data = await self.ws.recv()
-                if isinstance(data, str):
-                    self._read_buffer.extend(data.encode('utf-8'))
-                else:
-                    self._read_buffer.extend(data)
-            except websockets.exceptions.ConnectionClosed:
+        """
+        Returns queued frames of the same type totalling at most n, or one
+        whole frame if it's larger. Returns b'' once the connection closes,
+        or raises whatever stopped the receiving task.
+        """
+        if self._recv_task is None:
+            self._recv_task = asyncio.create_task(self._recv_loop())
+        while not self._frames:
+            if self._closed:
+                error, self._error = self._error, None
+                if error:
+                    raise error
                 return b''
+            self._frame_ready.clear()
+            await self._frame_ready.wait()
+
+        frames = self._frames
+        first = frames.popleft()
+        if not frames or len(first) + len(frames[0]) > n or type(frames[0]) is not type(first):
+            self._space_ready.set()
+            return first
 
-        chunk = self._read_buffer[:n]
-        self._read_buffer = self._read_buffer[n:]
-        return bytes(chunk)
+        parts = [first]
+        size = len(first)
+        while frames and size + len(frames[0]) <= n and type(frames[0]) is type(first):
+            size += len(frames[0])
+            parts.append(frames.popleft())
+        self._space_ready.set()
+        return first[:0].join(parts)
 
     def write(self, data):
         self._write_buffer.extend(data)
@@ -33,6 +85,8 @@ class WebSocketStreamAdapter:
             self._write_buffer.clear()
 
     def close(self):
+        if self._recv_task:
+            self._recv_task.cancel()
         asyncio.create_task(self.ws.close())
 
     async def wait_closed(self):
@@ -45,31 +99,255 @@ class WebSocketStreamAdapter:
             return getattr(self.ws, 'secure', False)
         return None
 
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    SSLContext that offers the last TLS session seen for a host, so repeat
+    connections can skip the full handshake. asyncio and websockets create
+    their SSL objects through wrap_bio, which is where the session is applied.
+    """
+    def __init__(self, *args, **kwargs):
+        # SSLContext is configured in __new__
+        self.sessions = {}  # {server_hostname: SSLSession}
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and server_hostname:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+    def remember(self, server_hostname, session):
+        if session is None or not server_hostname:
+            return
+        self.sessions.pop(server_hostname, None)
+        self.sessions[server_hostname] = session
+        while len(self.sessions) > CONNECTION_CACHE_SIZE:
+            self.sessions.pop(next(iter(self.sessions)))
+
+_ssl_contexts = {}  # {verify: ResumingSSLContext}
+
+def get_ssl_context(verify=True):
+    """Returns the process-wide client SSL context for a verification mode."""
+    context = _ssl_contexts.get(verify)
+    if context is None:
+        context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        if verify:
+            context.load_default_certs(ssl.Purpose.SERVER_AUTH)
+        else:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        _ssl_contexts[verify] = context
+    return context
+
+def remember_tls_session(writer):
+    """
+    Stores the TLS session of a stream writer or transport for reuse by the
+    next connection to the same host. Worth calling again before closing,
+    since TLS 1.3 servers only issue session tickets after the handshake.
+    """
+    ssl_object = writer.get_extra_info('ssl_object') if hasattr(writer, 'get_extra_info') else None
+    if isinstance(ssl_object, ssl.SSLObject) and isinstance(ssl_object.context, ResumingSSLContext):
+        ssl_object.context.remember(ssl_object.server_hostname, ssl_object.session)
+
+_dns_cache = {}    # {(host, port): (expires, addresses)}
+_dns_pending = {}  # {(host, port): Task} so concurrent reconnects share one lookup
+
+async def _lookup(key):
+    host, port = key
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys((family, sockaddr) for family, _, _, _, sockaddr in infos))
+        _dns_cache.pop(key, None)
+        _dns_cache[key] = (time.monotonic() + DNS_CACHE_TTL, addresses)
+        while len(_dns_cache) > CONNECTION_CACHE_SIZE:
+            _dns_cache.pop(next(iter(_dns_cache)))
+        return addresses
+    finally:
+        del _dns_pending[key]
+
+async def resolve(host, port):
+    """
+    Resolves host to a list of (family, sockaddr), cached for DNS_CACHE_TTL.
+    """
+    key = (host, port)
+    cached = _dns_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    task = _dns_pending.get(key)
+    if task is None:
+        # The lookup belongs to no caller, so one giving up doesn't cancel it for the rest
+        task = _dns_pending[key] = asyncio.create_task(_lookup(key))
+        task.add_done_callback(lambda t: t.cancelled() or t.exception()) # Don't warn when nobody was left waiting
+    return await asyncio.shield(task)
+
+def forget_address(host, port):
+    """Drops a cached lookup, e.g. after every address failed."""
+    _dns_cache.pop((host, port), None)
+
+def interleave_families(addresses):
+    """Alternates address families, starting with the first one returned (RFC 8305)."""
+    by_family = {}
+    for address in addresses:
+        by_family.setdefault(address[0], []).append(address)
+    groups = list(by_family.values())
+    return [group[i] for i in range(max(map(len, groups), default=0)) for group in groups if i < len(group)]
+
+async def _await_attempt(attempt):
+    # websockets.connect() returns an awaitable object rather than a coroutine
+    return await attempt()
+
+async def race_attempts(attempts, delay, discard):
+    """
+    Runs the callables in attempts, each returning an awaitable, starting each one delay seconds
+    after the previous one, or right away when a running attempt fails.
+    Returns the first result; the others are cancelled and discard() is called
+    on any extra result. SSL errors are raised at once since every address
+    would fail the same way.
+    """
+    remaining = list(attempts)
+    pending = set()
+    errors = []
+    try:
+        while remaining or pending:
+            if remaining:
+                pending.add(asyncio.create_task(_await_attempt(remaining.pop(0))))
+            done, pending = await asyncio.wait(
+                pending, timeout=delay if remaining else None,
+                return_when=asyncio.FIRST_COMPLETED)
+            winner = None
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    if winner is None:
+                        winner = task.result()
+                    else:
+                        discard(task.result())
+                elif isinstance(error, ssl.SSLError):
+                    if winner is not None:
+                        discard(winner)
+                    raise error
+                else:
+                    errors.append(error)
+            if winner is not None:
+                return winner
+        raise errors[-1] if errors else OSError("No addresses to connect to")
+    finally:
+        for task in pending:
+            task.cancel()
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if not isinstance(result, BaseException):
+                discard(result)
+
+def close_stream(stream):
+    stream[1].close()
+
+async def open_tcp(host, port, ssl_context=None):
+    """
+    Opens a stream to host, racing its cached addresses happy-eyeballs style
+    so a dead route doesn't hold up the rest. TLS still verifies and resumes
+    against the host name.
+    """
+    addresses = interleave_families(await resolve(host, port))
+    attempts = [
+        functools.partial(asyncio.open_connection, sockaddr[0], port, family=family,
+                          ssl=ssl_context, server_hostname=host if ssl_context else None)
+        for family, sockaddr in addresses
+    ]
+    try:
+        return await race_attempts(attempts, HAPPY_EYEBALLS_DELAY, close_stream)
+    except ssl.SSLError:
+        raise
+    except OSError:
+        forget_address(host, port)
+        raise
+
+async def open_tls_racing(host, port, on_warning):
+    """
+    Opens verified and lenient TLS connections at the same time and keeps the
+    verified one unless verification fails, so a bad certificate costs no
+    extra round trips.
+    """
+    verified = asyncio.create_task(open_tcp(host, port, get_ssl_context(verify=True)))
+    lenient = asyncio.create_task(open_tcp(host, port, get_ssl_context(verify=False)))
+    try:
+        try:
+            stream = await verified
+        except ssl.SSLError as e:
+            await on_warning(f"TLS Verification failed: {e}. Using the lenient connection...")
+            return await lenient
+    except BaseException:
+        lenient.cancel()
+        raise
+    lenient.cancel()
+    try:
+        close_stream(await lenient)
+    except asyncio.CancelledError:
+        if not lenient.cancelled() or asyncio.current_task().cancelling():
+            # We were cancelled ourselves (e.g. the connect timeout fired) while waiting
+            close_stream(stream)
+            raise
+    except Exception:
+        pass
+    return stream
+
+def ws_compression_options():
+    """Returns websockets.connect() arguments for the configured permessage-deflate settings."""
+    if WS_COMPRESSION != 'deflate':
+        return {'compression': None}
+    window = {}
+    if WS_DEFLATE_WINDOW_BITS:
+        window = {'server_max_window_bits': WS_DEFLATE_WINDOW_BITS, 'client_max_window_bits': WS_DEFLATE_WINDOW_BITS}
+    factory = ClientPerMessageDeflateFactory(compress_settings={'memLevel': WS_DEFLATE_MEM_LEVEL}, **window)
+    return {'compression': None, 'extensions': [factory]}
+
+async def open_ws(ws_url, host, port, ssl_context):
+    """Opens a websocket, racing the host's cached addresses like open_tcp."""
+    addresses = interleave_families(await resolve(host, port))
+    attempts = []
+    for family, sockaddr in addresses:
+        connect_args = {'host': sockaddr[0], 'port': port, 'family': family}
+        if ssl_context:
+            # The URL still supplies the Host header; SNI comes from here
+            connect_args['server_hostname'] = host
+        attempts.append(functools.partial(
+            websockets.connect, ws_url, ssl=ssl_context, ping_timeout=None,
+            **ws_compression_options(), **connect_args))
+    try:
+        return await race_attempts(attempts, HAPPY_EYEBALLS_DELAY, lambda ws: asyncio.create_task(ws.close()))
+    except ssl.SSLError:
+        raise
+    except OSError:
+        forget_address(host, port)
+        raise
+
 async def connect_mud(protocol, host, port, path='/', on_warning=None):
     """
     Establishes a connection to the MUD based on the protocol.
     Returns (reader, writer).
     on_warning is an optional async callback for TLS fallback warnings.
+    Raises asyncio.TimeoutError if it takes longer than CONNECT_TIMEOUT.
     """
+    return await asyncio.wait_for(_connect_mud(protocol, host, port, path, on_warning), timeout=CONNECT_TIMEOUT)
+
+async def _connect_mud(protocol, host, port, path, on_warning):
     reader, writer = None, None
 
     if protocol in ('telnet', 'telnets'):
         use_ssl = (protocol == 'telnets')
         if use_ssl:
-            ssl_context = ssl.create_default_context()
-            try:
-                reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
-            except (ssl.SSLError, ConnectionRefusedError) as e:
-                if isinstance(e, ssl.SSLError) and on_warning:
-                    await on_warning(f"TLS Verification failed: {e}. Retrying leniently...")
-                    ssl_context = ssl.create_default_context()
-                    ssl_context.check_hostname = False
-                    ssl_context.verify_mode = ssl.CERT_NONE
-                    reader, writer = await asyncio.open_connection(host, port, ssl=ssl_context)
-                else:
-                    raise e
+            if TLS_RACE_LENIENT and on_warning:
+                reader, writer = await open_tls_racing(host, port, on_warning)
+            else:
+                try:
+                    reader, writer = await open_tcp(host, port, get_ssl_context(verify=True))
+                except (ssl.SSLError, ConnectionRefusedError) as e:
+                    if isinstance(e, ssl.SSLError) and on_warning:
+                        await on_warning(f"TLS Verification failed: {e}. Retrying leniently...")
+                        reader, writer = await open_tcp(host, port, get_ssl_context(verify=False))
+                    else:
+                        raise e
+            remember_tls_session(writer)
         else:
-            reader, writer = await asyncio.open_connection(host, port)
+            reader, writer = await open_tcp(host, port)
 
         sock = writer.get_extra_info('socket')
         if sock:
@@ -82,22 +360,22 @@ async def connect_mud(protocol, host, port, path='/', on_warning=None):
 
         ssl_context = None
         if use_ssl:
-            ssl_context = ssl.create_default_context()
+            ssl_context = get_ssl_context(verify=True)
 
         try:
-            ws = await websockets.connect(ws_url, ssl=ssl_context, ping_timeout=None)
+            ws = await open_ws(ws_url, host, port, ssl_context)
         except (ssl.SSLError, Exception) as e:
             if isinstance(e, ssl.SSLError) and on_warning:
                 await on_warning(f"WSS Verification failed: {e}. Retrying leniently...")
-                ssl_context = ssl.create_default_context()
-                ssl_context.check_hostname = False
-                ssl_context.verify_mode = ssl.CERT_NONE
-                ws = await websockets.connect(ws_url, ssl=ssl_context, ping_timeout=None)
+                ssl_context = get_ssl_context(verify=False)
+                ws = await open_ws(ws_url, host, port, ssl_context)
             else:
                 raise e
 
         adapter = WebSocketStreamAdapter(ws)
         reader, writer = adapter, adapter
+        if use_ssl:
+            remember_tls_session(getattr(ws, 'transport', None))
 
     else:
         raise ValueError(f"Unknown protocol: {protocol}")
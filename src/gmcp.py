@@ -5,7 +5,8 @@ from .config import APP_VERSION
 class GmcpHandler:
     """
     Handles GMCP protocol logic, including handshake and core modules.
-    Extensible for future module additions.
+    Other modules are added by subscribing to their packages; payloads are only
+    JSON-decoded and stored when someone is subscribed to them.
     """
     def __init__(self, protocol):
         self.protocol = protocol
@@ -13,27 +14,78 @@ class GmcpHandler:
         self.last_ping_sent_time = None
         self.last_rtt = None
 
-        # Dispatch table for GMCP packages
-        self.handlers = {
-            "core.ping": self._handle_core_ping
-        }
+        # {package (lowercase): [callback(package, data)]}
+        self.subscribers = {}
+        # {package (lowercase): module it was subscribed under}
+        self.package_modules = {}
+        # {module name: version} advertised through Core.Supports
+        self.modules = {"Core": 1}
+        # {package (lowercase): latest data} for subscribed packages
+        self.store = {}
+
+        self.subscribe("Core.Ping", self._handle_core_ping)
+
+    def subscribe(self, package, callback, module=None, version=1):
+        """
+        Registers callback(package, data) for a package such as "Room.Info".
+        The module (default: first part of the package) is advertised to the
+        server so it starts sending that data.
+        """
+        key = package.lower()
+        self.subscribers.setdefault(key, []).append(callback)
+
+        module = module or package.split('.', 1)[0]
+        self.package_modules[key] = module
+        if module not in self.modules:
+            self.modules[module] = version
+            if self.enabled:
+                self.queue("Core.Supports.Add", [f"{module} {version}"])
+
+    def unsubscribe(self, package, callback):
+        key = package.lower()
+        callbacks = self.subscribers.get(key)
+        if not callbacks or callback not in callbacks:
+            return
+        callbacks.remove(callback)
+        if callbacks:
+            return
+        del self.subscribers[key]
+        self.store.pop(key, None)
+
+        # Stop advertising the module once nothing subscribed under it is left
+        module = self.package_modules.pop(key)
+        if module == "Core" or module not in self.modules or module in self.package_modules.values():
+            return
+        del self.modules[module]
+        if self.enabled:
+            self.queue("Core.Supports.Remove", [module])
+
+    def wants(self, package):
+        """Returns True if an incoming package would be used."""
+        return package.lower() in self.subscribers
 
     async def enable(self):
         self.enabled = True
         from .protocol import Telnet
-        await self.protocol.send_command(Telnet.DO, Telnet.GMCP)
+        self.protocol.queue_command(Telnet.DO, Telnet.GMCP)
 
         # Core.Hello must be the first message
-        await self.send("Core.Hello", {
+        self.queue("Core.Hello", {
             "client": "DiscordMudClient",
             "version": APP_VERSION
         })
         # Advertise supported modules
-        await self.send("Core.Supports.Set", ["Core 1"])
+        await self.send("Core.Supports.Set", [f"{name} {version}" for name, version in self.modules.items()])
 
     async def send(self, package, data=None):
+        future = self.queue(package, data)
+        if future:
+            await self.protocol.wait_written(future)
+
+    def queue(self, package, data=None):
+        """Queues a GMCP message on the protocol's writer; returns None if GMCP is off."""
         if not self.enabled:
-            return
+            return None
 
         if package.lower() == "core.ping":
             self.last_ping_sent_time = asyncio.get_event_loop().time()
@@ -43,7 +95,7 @@ class GmcpHandler:
             payload += " " + json.dumps(data)
 
         from .protocol import Telnet
-        await self.protocol.send_subnegotiation(Telnet.GMCP, payload.encode('utf-8'))
+        return self.protocol.queue_subnegotiation(Telnet.GMCP, payload.encode('utf-8'))
 
     def handle(self, data: bytes):
         """Parses and dispatches incoming GMCP messages."""
@@ -53,17 +105,31 @@ class GmcpHandler:
                 return
 
             parts = msg.split(' ', 1)
-            package_cmd = parts[0].lower()
+            package = parts[0]
+            package_cmd = package.lower()
             arg = parts[1] if len(parts) > 1 else None
 
-            handler = self.handlers.get(package_cmd)
-            if handler:
-                handler(arg)
+            callbacks = self.subscribers.get(package_cmd)
+            if callbacks:
+                value = json.loads(arg) if arg else None
+                self._update_store(package_cmd, value)
+                for callback in list(callbacks):
+                    callback(package, value)
         except Exception as e:
             # Silently ignore malformed GMCP
             pass
 
-    def _handle_core_ping(self, arg):
+    def _update_store(self, key, value):
+        """Merges partial object updates (e.g. Char.Vitals) into the stored state."""
+        current = self.store.get(key)
+        if isinstance(current, dict) and isinstance(value, dict):
+            current.update(value)
+        elif isinstance(value, dict):
+            self.store[key] = dict(value)
+        else:
+            self.store[key] = value
+
+    def _handle_core_ping(self, package, data):
         if self.last_ping_sent_time is not None:
             now = asyncio.get_event_loop().time()
             self.last_rtt = int((now - self.last_ping_sent_time) * 1000)
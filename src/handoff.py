@@ -0,0 +1,259 @@
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+from .config import HANDOFF_TIMEOUT
+from .triggers import Trigger
+
+# Each record is a length-prefixed JSON payload; a session's socket rides
+# along with its header as SCM_RIGHTS ancillary data.
+HEADER = struct.Struct('!I')
+MAX_RECORD_SIZE = 16 * 1024 * 1024
+HANDOFF_ACK = b'ok'
+
+class HandoffUnconfirmed(ConnectionError):
+    """Every record was sent but the receiver never acknowledged them."""
+
+def _encode_bytes(data):
+    return base64.b64encode(bytes(data)).decode('ascii')
+
+def _decode_bytes(text):
+    return base64.b64decode(text)
+
+def unread_bytes(reader):
+    """
+    Returns what a StreamReader has taken off the socket but nobody has read.
+    asyncio keeps this in a private buffer, so check its shape rather than
+    trust it across Python versions; transfer_blocker() refuses readers
+    where it doesn't hold.
+    """
+    buffer = getattr(reader, '_buffer', None)
+    if not isinstance(buffer, bytearray):
+        raise TypeError(f"Unsupported StreamReader internals on Python {sys.version.split()[0]}")
+    return bytes(buffer)
+
+def transfer_blocker(session):
+    """Returns why a session's connection can't be handed off, or None if it can."""
+    if not isinstance(session.writer, asyncio.StreamWriter):
+        return "websocket"
+    if not isinstance(getattr(session.reader, '_buffer', None), bytearray):
+        return "unsupported Python"
+    if session.writer.get_extra_info('ssl_object') is not None:
+        return "TLS"
+    if session.protocol.compressing:
+        return "MCCP"
+    if session.writer.get_extra_info('socket') is None:
+        return "no socket"
+    return None
+
+def export_session(session, unread):
+    """Serializes what a new process needs to carry on a detached session."""
+    protocol = session.protocol
+    decoder_buffer, decoder_flag = protocol.decoder.getstate()
+    transformer = protocol.ansi_transformer
+    return {
+        'type': 'session',
+        'user_id': session.user_id,
+        'username': session.username,
+        'channel_id': session.channel.id,
+        'url': session.url,
+        'echo_off': session.echo_off,
+        'unread': _encode_bytes(unread),
+        'output': session.buffer.state_prefix() + str(session.buffer) if session.buffer else "",
+        'telnet': {
+            'state': protocol.state,
+            'sb_option': protocol.sb_option,
+            'sb_data': _encode_bytes(protocol.sb_data),
+            'sb_discard': protocol.sb_discard,
+            'iac_cmd': protocol.iac_cmd,
+            'encoding': protocol.encoding,
+            'decoder': [_encode_bytes(decoder_buffer), decoder_flag],
+        },
+        'ansi': {
+            'state': protocol.ansi.state,
+            'current_ansi': _encode_bytes(protocol.ansi.current_ansi),
+            'sgr': vars(transformer.state),
+            'emitted_sgr': vars(transformer.emitted_state),
+        },
+        'gmcp': {
+            'enabled': protocol.gmcp.enabled,
+            'last_rtt': protocol.gmcp.last_rtt,
+            'store': protocol.gmcp.store,
+        },
+        'triggers': {
+            'held': session.triggers.held,
+            'partial_line': session.triggers.partial_line,
+            'sgr': vars(session.triggers.sgr),
+        },
+        'minimizer': dict(vars(session.minimizer)) if session.minimizer else None,
+    }
+
+def import_session(session, state):
+    """Restores exported state onto a session rebuilt around a handed-off socket."""
+    protocol = session.protocol
+    session.url = state['url']
+    session.echo_off = state['echo_off']
+
+    telnet = state['telnet']
+    protocol.set_encoding(telnet['encoding'])
+    decoder_buffer, decoder_flag = telnet['decoder']
+    protocol.decoder.setstate((_decode_bytes(decoder_buffer), decoder_flag))
+    protocol.state = telnet['state']
+    protocol.sb_option = telnet['sb_option']
+    protocol.sb_data = bytearray(_decode_bytes(telnet['sb_data']))
+    protocol.sb_discard = telnet['sb_discard']
+    protocol.iac_cmd = telnet['iac_cmd']
+
+    ansi = state['ansi']
+    protocol.ansi.state = ansi['state']
+    protocol.ansi.current_ansi = bytearray(_decode_bytes(ansi['current_ansi']))
+    vars(protocol.ansi_transformer.state).update(ansi['sgr'])
+    vars(protocol.ansi_transformer.emitted_state).update(ansi['emitted_sgr'])
+
+    gmcp = state['gmcp']
+    protocol.gmcp.enabled = gmcp['enabled']
+    protocol.gmcp.last_rtt = gmcp['last_rtt']
+    protocol.gmcp.store = gmcp['store']
+
+    # Partial lines held back for triggers or the minimizer
+    triggers = state['triggers']
+    session.triggers.held = triggers['held']
+    session.triggers.partial_line = triggers['partial_line']
+    vars(session.triggers.sgr).update(triggers['sgr'])
+    if state['minimizer'] and session.minimizer:
+        vars(session.minimizer).update(state['minimizer'])
+
+    # Bytes the old process had read but not yet parsed come first
+    session.reader.feed_data(_decode_bytes(state['unread']))
+    if state['output']:
+        session.buffer.append(state['output'])
+
+def export_user(manager, user_id):
+    """Serializes a user's aliases and triggers, which outlive their sessions."""
+    aliases = manager.aliases.get(user_id)
+    triggers = manager.triggers.get(user_id)
+    return {
+        'type': 'user',
+        'user_id': user_id,
+        'aliases': aliases.aliases if aliases else {},
+        'pacing': aliases.pacing if aliases else None,
+        'triggers': [
+            [t.pattern, t.action, t.is_regex, t.command]
+            for t in (triggers.triggers if triggers else [])
+        ],
+    }
+
+def import_user(manager, state):
+    user_id = state['user_id']
+    if state['aliases'] or state['pacing'] is not None:
+        expander = manager.get_aliases(user_id)
+        expander.aliases.update(state['aliases'])
+        if state['pacing'] is not None:
+            expander.pacing = state['pacing']
+    if state['triggers']:
+        engine = manager.get_triggers(user_id)
+        for pattern, action, is_regex, command in state['triggers']:
+            engine.add(Trigger(pattern, action, is_regex=is_regex, command=command))
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Handoff connection closed early")
+        data.extend(chunk)
+    return bytes(data)
+
+def send_records(sock, records):
+    """
+    Sends (record, fd) pairs over a blocking Unix socket and waits for the
+    receiver to acknowledge them. The last record should be {'type': 'end'}.
+    """
+    for record, fd in records:
+        payload = json.dumps(record).encode('utf-8')
+        header = HEADER.pack(len(payload))
+        if fd is None:
+            sock.sendall(header)
+        else:
+            sent = socket.send_fds(sock, [header], [fd])
+            sock.sendall(header[sent:])
+        sock.sendall(payload)
+    try:
+        ack = _recv_exact(sock, len(HANDOFF_ACK))
+    except OSError as e:
+        raise HandoffUnconfirmed(f"No acknowledgement: {e}") from e
+    if ack != HANDOFF_ACK:
+        raise HandoffUnconfirmed("Handoff was not acknowledged")
+
+def recv_records(sock):
+    """Receives (record, fd) pairs until the end record, then acknowledges them."""
+    records = []
+    try:
+        while True:
+            header, fds, _, _ = socket.recv_fds(sock, HEADER.size, 1)
+            if not header:
+                raise ConnectionError("Handoff connection closed early")
+            header += _recv_exact(sock, HEADER.size - len(header))
+            size, = HEADER.unpack(header)
+            if size > MAX_RECORD_SIZE:
+                raise ValueError(f"Handoff record too large: {size} bytes")
+            record = json.loads(_recv_exact(sock, size))
+            records.append((record, fds[0] if fds else None))
+            if record['type'] == 'end':
+                break
+        sock.sendall(HANDOFF_ACK)
+    except BaseException:
+        for _, fd in records:
+            if fd is not None:
+                os.close(fd)
+        raise
+    return records
+
+def bind_handoff_socket(path):
+    """Listens on path for the next process, replacing any stale socket file."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(1)
+    listener.setblocking(False)
+    return listener
+
+async def serve_handoff(listener, on_request):
+    """
+    Waits for a newly started process to connect and passes the connection
+    to on_request, which hands the sessions over.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            conn, _ = await loop.sock_accept(listener)
+            conn.setblocking(True)
+            conn.settimeout(HANDOFF_TIMEOUT)
+            await on_request(conn)
+    finally:
+        listener.close()
+
+async def request_handoff(path):
+    """
+    Asks a running process for its sessions. Returns the received
+    (record, fd) pairs, or an empty list if no process is listening.
+    """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return []
+        sock.setblocking(True)
+        sock.settimeout(HANDOFF_TIMEOUT)
+        return await asyncio.to_thread(recv_records, sock)
+    finally:
+        sock.close()
@@ -0,0 +1,71 @@
+import re
+
+TRAILING_SPACE_RE = re.compile(r'[ \t]+\n')
+BLANK_RUN_RE = re.compile(r'\n{3,}')
+
+class OutputMinimizer:
+    """
+    Optional stage between TelnetProtocol.feed and the session buffer that drops
+    characters which don't change what the player sees: carriage returns,
+    trailing whitespace, runs of blank lines and prompts repeated after an
+    empty command. State is kept across calls since reads don't line up with lines.
+    """
+    def __init__(self):
+        self.pending_space = "" # Trailing whitespace held until we know the line continues
+        self.newline_run = 0    # Newlines at the end of what we have emitted
+        self.line = ""          # Emitted text of the current, unterminated line
+        self.last_prompt = None # Line left unterminated at the end of the last read
+        self.empty_commands = 0 # Empty commands sent since last_prompt was shown
+        self.chars_in = 0
+        self.chars_out = 0
+
+    @property
+    def saved(self):
+        return self.chars_in - self.chars_out - len(self.pending_space)
+
+    def note_commands(self, commands):
+        """Records commands sent to the MUD; an empty one usually just redraws the prompt."""
+        self.empty_commands += sum(1 for command in commands if not command.strip())
+
+    def process(self, text):
+        self.chars_in += len(text)
+        text = self.pending_space + text.replace('\r', '')
+        text = TRAILING_SPACE_RE.sub('\n', text)
+
+        stripped = text.rstrip(' \t')
+        self.pending_space = text[len(stripped):]
+        text = stripped
+        if not text:
+            return ""
+
+        # Collapse blank runs, including one continuing from the previous call
+        text = BLANK_RUN_RE.sub('\n\n', text)
+        body = text.lstrip('\n')
+        leading = len(text) - len(body)
+        if leading:
+            text = '\n' * min(leading, max(0, 2 - self.newline_run)) + body
+
+        starts_line = bool(leading or self.newline_run or not self.line)
+        if body and '\n' not in body and starts_line and body == self.last_prompt and self.empty_commands:
+            # The prompt redrawn on a fresh line in answer to an empty command.
+            # Completed lines never get here since body has no newline.
+            self.empty_commands -= 1
+            return ""
+
+        last_nl = body.rfind('\n')
+        if not body:
+            self.newline_run += leading
+            self.line = ""
+        elif last_nl == -1:
+            self.line = body if starts_line else self.line + body
+            self.newline_run = 0
+        else:
+            self.line = body[last_nl + 1:]
+            self.newline_run = len(body) - len(body.rstrip('\n'))
+        if body:
+            # Only text left unterminated at the end of a read can be a prompt
+            self.last_prompt = self.line or None
+            self.empty_commands = 0
+
+        self.chars_out += len(text)
+        return text
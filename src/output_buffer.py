@@ -0,0 +1,246 @@
+import re
+from bisect import bisect_left, bisect_right
+from collections import deque
+from .ansi_transformer import SGRState, parse_sgr_params
+from .utils import ANSI_STRIP_RE, URL_RE, clean_url
+
+# Complete CSI sequence, and one cut off by the end of an append
+CSI_RE = re.compile(r'\x1b\[([0-?]*)[ -/]*([@-~])')
+CSI_PARTIAL_RE = re.compile(r'\x1b(\[[0-?]*[ -/]*)?\Z')
+
+# Characters kept for rescanning in case a URL scheme is cut off by an append
+URL_SCHEME_LOOKBACK = len("https://")
+
+# Consumed index entries are dropped in batches of this size
+INDEX_COMPACT_SIZE = 4096
+
+class OutputBuffer:
+    """
+    Pending MUD output waiting to be sent to Discord.
+    Appended text is kept as a deque of segments, so reading and consuming a
+    prefix never copies the rest of the backlog.
+    Newline, escape-sequence and URL positions are indexed as text arrives so
+    chunk boundaries and links can be found without rescanning, and the SGR
+    state at the consumed boundary is tracked so the next chunk can restore it.
+    """
+    def __init__(self):
+        self.segments = deque()
+        self.offset = 0 # Characters of segments[0] already consumed
+        self.length = 0
+
+        # Absolute positions (counted from the first character ever appended)
+        self.start = 0
+        self.end = 0
+        self.newlines = []
+        self.newline_head = 0
+        self.escape_starts = []
+        self.escape_ends = []
+        self.escape_params = [] # SGR parameter string, or None for other CSI
+        self.escape_head = 0
+        self.open_escape_start = None
+        self.open_escape_text = ""
+
+        self.url_starts = []
+        self.url_values = []
+        self.url_head = 0
+        # Tail that may still be part of a URL continued by the next append
+        self.url_pending_start = 0
+        self.url_pending_text = ""
+
+        # SGR state in effect at self.start
+        self.sgr = SGRState()
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length > 0
+
+    def __str__(self):
+        return self.peek(self.length)
+
+    def append(self, text):
+        if not text:
+            return
+        base = self.end
+        i = text.find('\n')
+        while i != -1:
+            self.newlines.append(base + i)
+            i = text.find('\n', i + 1)
+        self._index_escapes(text, base)
+        self._index_urls(text)
+
+        self.segments.append(text)
+        self.length += len(text)
+        self.end += len(text)
+
+    def _index_escapes(self, text, base):
+        if self.open_escape_start is not None:
+            # Complete the sequence that was cut off by the previous append
+            base = self.open_escape_start
+            text = self.open_escape_text + text
+            self.open_escape_start = None
+            self.open_escape_text = ""
+
+        i = text.find('\x1b')
+        while i != -1:
+            match = CSI_RE.match(text, i)
+            if match:
+                self.escape_starts.append(base + i)
+                self.escape_ends.append(base + match.end())
+                self.escape_params.append(match.group(1) if match.group(2) == 'm' else None)
+                i = text.find('\x1b', match.end())
+            elif CSI_PARTIAL_RE.match(text, i):
+                self.open_escape_start = base + i
+                self.open_escape_text = text[i:]
+                break
+            else:
+                i = text.find('\x1b', i + 1)
+
+    def _index_urls(self, text, final=False):
+        """
+        Records URLs in the pending tail plus text. Matches that could still be
+        extended by a later append (including a wrapped line) stay pending
+        unless final is set.
+        """
+        base = self.url_pending_start
+        text = self.url_pending_text + text
+        plain, plain_starts, raw_starts = strip_ansi_with_map(text)
+
+        keep_from = len(plain) if final else max(0, len(plain) - URL_SCHEME_LOOKBACK)
+        for match in URL_RE.finditer(plain):
+            end = match.end()
+            if not final and (end == len(plain) or (end + 1 == len(plain) and plain[end] == '\n')):
+                keep_from = match.start()
+                break
+            url = clean_url(match.group())
+            if url:
+                self.url_starts.append(base + map_offset(match.start(), plain_starts, raw_starts))
+                self.url_values.append(url)
+            keep_from = max(keep_from, end)
+
+        raw_keep = map_offset(keep_from, plain_starts, raw_starts) if keep_from < len(plain) else len(text)
+        self.url_pending_start = base + raw_keep
+        self.url_pending_text = text[raw_keep:]
+
+    def urls_in(self, n):
+        """Returns the unique URLs that start within the first n characters."""
+        if self.url_pending_text and self.url_pending_start < self.start + n:
+            # The chunk reaches text that is still pending; settle it now
+            self._index_urls("", final=True)
+        end = bisect_left(self.url_starts, self.start + n, self.url_head)
+        return list(dict.fromkeys(self.url_values[self.url_head:end]))
+
+    def peek(self, n):
+        """Returns up to the first n characters without consuming them."""
+        parts = []
+        offset = self.offset
+        for segment in self.segments:
+            if n <= 0:
+                break
+            part = segment[offset:offset + n]
+            parts.append(part)
+            n -= len(part)
+            offset = 0
+        return "".join(parts)
+
+    def consume(self, n):
+        """Drops the first n characters."""
+        n = min(n, self.length)
+        self.length -= n
+        self.start += n
+        while n:
+            available = len(self.segments[0]) - self.offset
+            if n >= available:
+                self.segments.popleft()
+                self.offset = 0
+                n -= available
+            else:
+                self.offset += n
+                n = 0
+
+        self.newline_head = bisect_left(self.newlines, self.start, self.newline_head)
+        while self.escape_head < len(self.escape_starts) and self.escape_starts[self.escape_head] < self.start:
+            params = self.escape_params[self.escape_head]
+            if params is not None:
+                self.sgr.apply_params(parse_sgr_params(params))
+            self.escape_head += 1
+        self.url_head = bisect_left(self.url_starts, self.start, self.url_head)
+        self._compact()
+
+    def _compact(self):
+        if self.newline_head >= INDEX_COMPACT_SIZE:
+            del self.newlines[:self.newline_head]
+            self.newline_head = 0
+        if self.escape_head >= INDEX_COMPACT_SIZE:
+            del self.escape_starts[:self.escape_head]
+            del self.escape_ends[:self.escape_head]
+            del self.escape_params[:self.escape_head]
+            self.escape_head = 0
+        if self.url_head >= INDEX_COMPACT_SIZE:
+            del self.url_starts[:self.url_head]
+            del self.url_values[:self.url_head]
+            self.url_head = 0
+
+    def lstrip(self, chars):
+        """Drops leading characters found in chars and returns how many were dropped."""
+        dropped = 0
+        while self.segments:
+            segment = self.segments[0]
+            i = self.offset
+            while i < len(segment) and segment[i] in chars:
+                i += 1
+            stripped = i - self.offset
+            self.consume(stripped)
+            dropped += stripped
+            if i < len(segment):
+                break
+        return dropped
+
+    def last_newline(self, lo, hi):
+        """Returns the position of the last newline in [lo, hi), or -1."""
+        idx = bisect_left(self.newlines, self.start + hi, self.newline_head) - 1
+        if idx >= self.newline_head and self.newlines[idx] >= self.start + lo:
+            return self.newlines[idx] - self.start
+        return -1
+
+    def escape_boundary(self, pos):
+        """Moves pos back to the start of any escape sequence it would cut through."""
+        target = self.start + pos
+        idx = bisect_right(self.escape_starts, target - 1, self.escape_head) - 1
+        if idx >= self.escape_head and self.escape_ends[idx] > target:
+            return self.escape_starts[idx] - self.start
+        if self.open_escape_start is not None and self.start <= self.open_escape_start < target:
+            return self.open_escape_start - self.start
+        return pos
+
+    def state_prefix(self):
+        """Returns the SGR sequence that restores the state in effect at the start."""
+        return self.sgr.get_sequence(prev_state=SGRState())
+
+    def clear(self):
+        self.consume(self.length)
+
+def strip_ansi_with_map(text):
+    """
+    Strips SGR sequences, returning (plain, plain_starts, raw_starts) where each
+    run of plain text starting at plain_starts[k] began at raw_starts[k].
+    """
+    parts = []
+    plain_starts = [0]
+    raw_starts = [0]
+    plain_len = 0
+    last = 0
+    for match in ANSI_STRIP_RE.finditer(text):
+        parts.append(text[last:match.start()])
+        plain_len += match.start() - last
+        last = match.end()
+        plain_starts.append(plain_len)
+        raw_starts.append(last)
+    parts.append(text[last:])
+    return "".join(parts), plain_starts, raw_starts
+
+def map_offset(pos, plain_starts, raw_starts):
+    """Maps a position in stripped text back to the raw text."""
+    k = bisect_right(plain_starts, pos) - 1
+    return raw_starts[k] + (pos - plain_starts[k])
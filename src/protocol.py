@@ -1,10 +1,11 @@
 import asyncio
 import codecs
+import re
 import zlib
-from .config import MAX_BUFFER_SIZE, ANSI_TIMEOUT, TRANSLITERATE
+from .config import MAX_BUFFER_SIZE, ANSI_TIMEOUT, TRANSLITERATE, MCCP_CHUNK_SIZE, MCCP_MAX_EXPANSION, MAX_SUBNEGOTIATION_SIZE
 from .gmcp import GmcpHandler
 from .utils import transliterate_emojis
-from .ansi_transformer import transform_ansi_to_discord
+from .ansi_transformer import AnsiTransformer
 
 class DecompressionError(Exception):
     """Raised when MCCP decompression fails."""
@@ -17,49 +18,83 @@ class Telnet:
     GMCP = 201
     IS, SEND, REQUEST, ACCEPTED, REJECTED = 0, 1, 1, 2, 3
     NOP = 241
+    GA, EOR = 249, 239
     BEL = 7
 
+# GMCP package names are shorter than this, so that's as far as we look for one
+GMCP_PACKAGE_MAX = 64
+
 # NAWS limits
 NAWS_MIN = 1
 NAWS_MAX = 65535
 
+# CSI sequences end with a byte in the 0x40-0x7E range
+CSI_FINAL_RE = re.compile(rb'[\x40-\x7e]')
+# Safety limit for unterminated CSI sequences
+CSI_MAX_LENGTH = 33
+
+# Escape sequences and bells in already-decoded text, and a CSI cut off at the end
+TEXT_CONTROL_RE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x07')
+TEXT_PARTIAL_CSI_RE = re.compile(r'\x1b(\[[0-?]*[ -/]*)?\Z')
+
 class AnsiLayer:
-    """Handles ANSI escape sequences."""
+    """
+    Handles ANSI escape sequences.
+    Input is consumed in runs: plain text is emitted as memoryview slices of the
+    fed buffer and only escape sequences are copied. Partial sequences are kept
+    in current_ansi and completed by the next feed().
+    """
     def __init__(self):
         self.state = "TEXT"
         self.current_ansi = bytearray()
-        self.output = [] # List of [type, bytearray]
+        self.output = [] # List of (type, bytes-like)
 
-    def feed_byte(self, byte):
-        if self.state == "TEXT":
-            if byte == 27: # ESC
+    def feed(self, data, start=0, end=None):
+        if end is None:
+            end = len(data)
+        view = memoryview(data)
+        i = start
+        while i < end:
+            if self.state == "TEXT":
+                esc = data.find(b'\x1b', i, end)
+                if esc == -1:
+                    self.output.append(("TEXT", view[i:end]))
+                    break
+                if esc > i:
+                    self.output.append(("TEXT", view[i:esc]))
                 self.state = "ESC"
-                self.current_ansi = bytearray([27])
-            else:
-                if not self.output or self.output[-1][0] != "TEXT":
-                    self.output.append(["TEXT", bytearray([byte])])
+                self.current_ansi = bytearray(b'\x1b')
+                i = esc + 1
+            elif self.state == "ESC":
+                byte = data[i]
+                self.current_ansi.append(byte)
+                if byte == ord('['):
+                    self.state = "CSI"
                 else:
-                    self.output[-1][1].append(byte)
-        elif self.state == "ESC":
-            self.current_ansi.append(byte)
-            if byte == ord('['):
-                self.state = "CSI"
-            else:
-                # Not a CSI, just output what we have as text and reset
-                if not self.output or self.output[-1][0] != "TEXT":
-                    self.output.append(["TEXT", self.current_ansi])
+                    # Not a CSI, just output what we have as text and reset
+                    self.output.append(("TEXT", bytes(self.current_ansi)))
+                    self.state = "TEXT"
+                i += 1
+            else: # CSI
+                limit = i + CSI_MAX_LENGTH - len(self.current_ansi)
+                match = CSI_FINAL_RE.search(data, i, min(limit, end))
+                if match:
+                    stop = match.end()
+                    self.current_ansi.extend(view[i:stop])
+                    self.output.append(("ANSI", bytes(self.current_ansi)))
+                    self.state = "TEXT"
+                elif limit <= end:
+                    stop = limit
+                    self.current_ansi.extend(view[i:stop])
+                    self.output.append(("TEXT", bytes(self.current_ansi)))
+                    self.state = "TEXT"
                 else:
-                    self.output[-1][1].extend(self.current_ansi)
-                self.state = "TEXT"
-        elif self.state == "CSI":
-            self.current_ansi.append(byte)
-            # Standard ANSI CSI sequence ends with a byte in 0x40-0x7E range
-            if 0x40 <= byte <= 0x7E:
-                self.output.append(["ANSI", self.current_ansi])
-                self.state = "TEXT"
-            elif len(self.current_ansi) > 32: # Safety limit
-                self.output.append(["TEXT", self.current_ansi])
-                self.state = "TEXT"
+                    stop = end
+                    self.current_ansi.extend(view[i:stop])
+                i = stop
+
+    def feed_byte(self, byte):
+        self.feed(bytes([byte]))
 
     def get_output(self):
         out = self.output
@@ -91,12 +126,24 @@ class TelnetProtocol:
         self.state = "DATA"
         self.sb_option = None
         self.sb_data = bytearray()
+        self.sb_discard = False # Why the current payload is being dropped: "size", "unwanted" or False
         self.iac_cmd = None
         self.ansi = AnsiLayer()
+        self.ansi_transformer = AnsiTransformer()
         self.encoding = 'utf-8'
         self.decoder = codecs.getincrementaldecoder(self.encoding)(errors='ignore')
         self.compressing = False
         self.decompressor = None
+        self.compressed_bytes = 0
+        self.decompressed_bytes = 0
+        self.text_pending = ""
+        self.prompt_mark = None # Output chunks seen before the last GA/EOR in this read
+        self.at_prompt = False  # Whether the last feed() ended on a GA/EOR-marked prompt
+        self.write_buffer = bytearray()
+        self.write_future = None
+        self.write_event = None
+        self.writer_task = None
+        self.write_closed = False
         self.gmcp = GmcpHandler(self)
 
     def set_encoding(self, encoding):
@@ -111,41 +158,148 @@ class TelnetProtocol:
     def feed(self, data: bytes):
         if data and self.session:
             self.session.notify_activity()
+        self.prompt_mark = None
         self._feed_internal(data)
 
         chunks = self.ansi.get_output()
-        result = ""
+        self.at_prompt = self.prompt_mark is not None and not any(
+            type == "TEXT" for type, _ in chunks[self.prompt_mark:])
+        result = []
         for type, content in chunks:
             if type == "TEXT":
-                result += self.decoder.decode(content)
+                result.append(self.ansi_transformer.feed_text(self.decoder.decode(content)))
             else: # ANSI
                 ansi_str = content.decode('ascii', errors='ignore')
-                result += transform_ansi_to_discord(ansi_str)
-        return result
+                result.append(self.ansi_transformer.feed(ansi_str))
+        return "".join(result)
+
+    def feed_text(self, text: str):
+        """
+        Feeds an already-decoded websocket text frame. Text frames carry no
+        Telnet commands, so they skip IAC parsing and the byte decoder.
+        """
+        if text and self.session:
+            self.session.notify_activity()
+        self.at_prompt = False
+        text = self.text_pending + text
+        self.text_pending = ""
+
+        transformer = self.ansi_transformer
+        result = []
+        last = 0
+        for match in TEXT_CONTROL_RE.finditer(text):
+            if match.start() > last:
+                result.append(transformer.feed_text(text[last:match.start()]))
+            last = match.end()
+            sequence = match.group()
+            if sequence == '\x07':
+                if self.session:
+                    self.session.bell_pending = True
+            else:
+                result.append(transformer.feed(sequence))
+
+        tail = text[last:]
+        partial = TEXT_PARTIAL_CSI_RE.search(tail)
+        if partial and len(partial.group()) < CSI_MAX_LENGTH:
+            # Finish the sequence with the next frame
+            self.text_pending = partial.group()
+            tail = tail[:partial.start()]
+        if tail:
+            result.append(transformer.feed_text(tail))
+        return "".join(result)
 
     def _feed_internal(self, data: bytes):
         if self.compressing:
             try:
-                decompressed = self.decompressor.decompress(data)
-                for byte in decompressed:
-                    self._feed_byte(byte)
-                if self.decompressor.eof:
-                    remainder = self.decompressor.unused_data
-                    self.compressing = False
-                    self.decompressor = None
-                    if remainder:
-                        self._feed_internal(remainder)
+                self._decompress(data)
             except zlib.error as e:
                 raise DecompressionError(str(e))
         else:
-            for i, byte in enumerate(data):
-                self._feed_byte(byte)
-                if self.compressing:
-                    # Compression started during processing of this buffer
-                    remaining = data[i+1:]
-                    if remaining:
-                        self._feed_internal(remaining)
-                    break
+            consumed = self._scan(data)
+            if self.compressing:
+                # Compression started during processing of this buffer
+                remaining = data[consumed:]
+                if remaining:
+                    self._feed_internal(remaining)
+
+    def _decompress(self, data: bytes):
+        """
+        Inflates MCCP data in slices of at most MCCP_CHUNK_SIZE bytes, parsing
+        each slice before inflating the next.
+        """
+        decompressor = self.decompressor
+        self.compressed_bytes += len(data)
+        expanded = 0
+        while True:
+            chunk = decompressor.decompress(data, MCCP_CHUNK_SIZE)
+            expanded += len(chunk)
+            if expanded > MCCP_MAX_EXPANSION:
+                raise DecompressionError(f"Read expanded beyond {MCCP_MAX_EXPANSION} bytes")
+            self.decompressed_bytes += len(chunk)
+            self._scan(chunk)
+
+            if decompressor.eof:
+                remainder = decompressor.unused_data
+                if self.decompressor is decompressor:
+                    self.compressing = False
+                    self.decompressor = None
+                if remainder:
+                    self.compressed_bytes -= len(remainder)
+                    self._feed_internal(remainder)
+                return
+
+            data = decompressor.unconsumed_tail
+            if not data and len(chunk) < MCCP_CHUNK_SIZE:
+                return
+
+    @property
+    def compression_ratio(self):
+        if not self.compressed_bytes:
+            return None
+        return self.decompressed_bytes / self.compressed_bytes
+
+    def _scan(self, data: bytes):
+        """
+        Runs a buffer through the Telnet state machine.
+        Plain DATA runs and SB payloads are located with find() and handed on as
+        slices; only IAC sequences go through _feed_byte.
+        Returns the number of bytes consumed, stopping right after the
+        subnegotiation that starts MCCP so the caller can decompress the rest.
+        """
+        n = len(data)
+        i = 0
+        next_iac = -1
+        next_bel = -1
+        was_compressing = self.compressing
+        while i < n:
+            if self.state == "DATA":
+                if next_iac != n and next_iac < i:
+                    next_iac = data.find(b'\xff', i)
+                    if next_iac == -1: next_iac = n
+                if next_bel != n and next_bel < i:
+                    next_bel = data.find(b'\x07', i)
+                    if next_bel == -1: next_bel = n
+                end = min(next_iac, next_bel)
+                if end > i:
+                    self.ansi.feed(data, i, end)
+                    i = end
+                    if i == n:
+                        break
+            elif self.state == "SB_DATA":
+                if next_iac != n and next_iac < i:
+                    next_iac = data.find(b'\xff', i)
+                    if next_iac == -1: next_iac = n
+                if next_iac > i:
+                    self._append_sb(data[i:next_iac])
+                    i = next_iac
+                    if i == n:
+                        break
+
+            self._feed_byte(data[i])
+            i += 1
+            if self.compressing and not was_compressing:
+                return i
+        return n
 
     def _feed_byte(self, byte):
         if self.state == "DATA":
@@ -163,6 +317,7 @@ class TelnetProtocol:
             elif byte == Telnet.SB:
                 self.state = "SB"
                 self.sb_data = bytearray()
+                self.sb_discard = False
             elif byte in (Telnet.WILL, Telnet.WONT, Telnet.DO, Telnet.DONT):
                 self.iac_cmd = byte
                 self.state = "IAC_COMMAND"
@@ -179,20 +334,46 @@ class TelnetProtocol:
             if byte == Telnet.IAC:
                 self.state = "SB_IAC"
             else:
-                self.sb_data.append(byte)
+                self._append_sb(bytes([byte]))
         elif self.state == "SB_IAC":
             if byte == Telnet.SE:
-                self.handle_subnegotiation(self.sb_option, self.sb_data)
+                if self.sb_discard == "size":
+                    self.client.log_event(self.user_id, self.username, f"Discarded subnegotiation for option {self.sb_option} over {MAX_SUBNEGOTIATION_SIZE} bytes.")
+                elif not self.sb_discard:
+                    self.handle_subnegotiation(self.sb_option, self.sb_data)
+                self.sb_data = bytearray()
                 self.state = "DATA"
             elif byte == Telnet.IAC:
-                self.sb_data.append(Telnet.IAC)
+                self._append_sb(b'\xff')
                 self.state = "SB_DATA"
             else:
                 # Invalid sequence, ignore and return to DATA
                 self.state = "DATA"
 
+    def _append_sb(self, data):
+        """
+        Buffers subnegotiation data, dropping the payload once it gets too
+        large or, for GMCP, as soon as its package turns out to be unused.
+        """
+        if self.sb_discard:
+            return
+        name_pending = len(self.sb_data) < GMCP_PACKAGE_MAX
+        self.sb_data.extend(data)
+        if self.sb_option == Telnet.GMCP and name_pending:
+            space = self.sb_data.find(b' ', 0, GMCP_PACKAGE_MAX)
+            if space != -1 and not self.gmcp.wants(self.sb_data[:space].decode('utf-8', errors='ignore')):
+                self.sb_discard = "unwanted"
+                self.sb_data = bytearray()
+                return
+        if len(self.sb_data) > MAX_SUBNEGOTIATION_SIZE:
+            self.sb_discard = "size"
+            self.sb_data = bytearray()
+
     def handle_single_byte_command(self, cmd):
-        if cmd == Telnet.BEL:
+        if cmd in (Telnet.GA, Telnet.EOR):
+            # Whatever text came before is a prompt
+            self.prompt_mark = len(self.ansi.output)
+        elif cmd == Telnet.BEL:
             if self.session:
                 self.session.bell_pending = True
 
@@ -200,7 +381,7 @@ class TelnetProtocol:
         if opt == Telnet.GMCP and cmd == Telnet.WILL:
             asyncio.create_task(self.gmcp.enable())
         elif opt == Telnet.ECHO:
-            asyncio.create_task(self.send_command((Telnet.DO if cmd == Telnet.WILL else Telnet.DONT), Telnet.ECHO))
+            self.queue_command((Telnet.DO if cmd == Telnet.WILL else Telnet.DONT), Telnet.ECHO)
             session = self.client.session_manager.get(self.user_id)
             if session:
                 if cmd == Telnet.WILL:
@@ -210,15 +391,15 @@ class TelnetProtocol:
                 else:
                     session.echo_off = False
         elif opt == Telnet.TTYPE and cmd == Telnet.DO:
-            asyncio.create_task(self.send_command(Telnet.WILL, Telnet.TTYPE))
+            self.queue_command(Telnet.WILL, Telnet.TTYPE)
         elif opt == Telnet.NAWS and cmd == Telnet.DO:
-            asyncio.create_task(self.send_naws())
+            self.queue_naws()
         elif opt == Telnet.CHARSET and cmd == Telnet.DO:
-            asyncio.create_task(self.send_command(Telnet.WILL, Telnet.CHARSET))
+            self.queue_command(Telnet.WILL, Telnet.CHARSET)
         elif opt == Telnet.CHARSET and cmd == Telnet.WILL:
-            asyncio.create_task(self.send_command(Telnet.DO, Telnet.CHARSET))
+            self.queue_command(Telnet.DO, Telnet.CHARSET)
         elif opt == Telnet.COMPRESS2 and cmd == Telnet.WILL:
-            asyncio.create_task(self.send_command(Telnet.DO, Telnet.COMPRESS2))
+            self.queue_command(Telnet.DO, Telnet.COMPRESS2)
 
     def handle_subnegotiation(self, opt, data):
         if opt == Telnet.GMCP:
@@ -229,7 +410,7 @@ class TelnetProtocol:
         elif opt == Telnet.TTYPE and len(data) > 0 and data[0] == Telnet.SEND:
             identity = f"DiscordMudClient (UID:{self.user_id})"
             packet = bytes([Telnet.IS]) + identity.encode('ascii', errors='ignore')
-            asyncio.create_task(self.send_subnegotiation(Telnet.TTYPE, packet))
+            self.queue_subnegotiation(Telnet.TTYPE, packet)
         elif opt == Telnet.CHARSET and len(data) > 0 and data[0] == Telnet.REQUEST:
             try:
                 # RFC 2066: The first byte after REQUEST is the separator
@@ -250,54 +431,145 @@ class TelnetProtocol:
                     name, codec = match
                     if self.set_encoding(codec):
                         packet = bytes([Telnet.ACCEPTED]) + name.encode('ascii')
-                        asyncio.create_task(self.send_subnegotiation(Telnet.CHARSET, packet))
+                        self.queue_subnegotiation(Telnet.CHARSET, packet)
                     else:
                         packet = bytes([Telnet.REJECTED])
-                        asyncio.create_task(self.send_subnegotiation(Telnet.CHARSET, packet))
+                        self.queue_subnegotiation(Telnet.CHARSET, packet)
                 else:
                     packet = bytes([Telnet.REJECTED])
-                    asyncio.create_task(self.send_subnegotiation(Telnet.CHARSET, packet))
+                    self.queue_subnegotiation(Telnet.CHARSET, packet)
             except Exception:
                 pass
 
     def escape_iac(self, data: bytes) -> bytes:
         return data.replace(b'\xff', b'\xff\xff')
 
-    async def safe_send(self, data):
+    def queue_send(self, data):
+        """
+        Queues data for the session's writer task and returns a future that
+        resolves once it has been written. Everything queued before the writer
+        runs goes out in a single write() and drain().
+        """
         if data and self.session:
             self.session.notify_activity()
+        if self.write_closed:
+            # Session is closing; there is nothing left to write to
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+            return future
+        if self.writer_task is None:
+            self.write_event = asyncio.Event()
+            self.writer_task = asyncio.create_task(self._write_loop())
+        if self.write_future is None:
+            self.write_future = asyncio.get_running_loop().create_future()
+        self.write_buffer.extend(data)
+        self.write_event.set()
+        return self.write_future
+
+    async def _write_loop(self):
+        future = None
         try:
-            self.writer.write(data)
-            await asyncio.wait_for(self.writer.drain(), timeout=ANSI_TIMEOUT)
-        except Exception as e:
-            self.client.log_event(self.user_id, self.username, f"Telnet write failed: {e}")
-            await self.client.close_session(self.user_id)
+            while True:
+                await self.write_event.wait()
+                self.write_event.clear()
+                data = bytes(self.write_buffer)
+                self.write_buffer.clear()
+                future = self.write_future
+                self.write_future = None
+                try:
+                    self.writer.write(data)
+                    await asyncio.wait_for(self.writer.drain(), timeout=ANSI_TIMEOUT)
+                except Exception as e:
+                    self.client.log_event(self.user_id, self.username, f"Telnet write failed: {e}")
+                    self.write_closed = True
+                    future.set_result(None)
+                    future = None
+                    await self.client.close_session(self.user_id)
+                    return
+                future.set_result(None)
+                future = None
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # Release anyone waiting on a batch that was cut off mid-drain
+            if future and not future.done():
+                future.cancel()
 
-    async def send_command(self, cmd, opt=None):
+    def close(self):
+        """Stops the writer task and releases anyone waiting on a pending write."""
+        self.write_closed = True
+        if self.writer_task and self.writer_task != asyncio.current_task():
+            self.writer_task.cancel()
+        if self.write_future and not self.write_future.done():
+            self.write_future.cancel()
+        self.write_future = None
+
+    async def wait_written(self, future):
+        """
+        Waits for a future from queue_send(). Raises ConnectionError if the
+        session closed before the data could be written.
+        """
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if future.cancelled() and not asyncio.current_task().cancelling():
+                raise ConnectionError("Session closed before the data was written")
+            raise
+
+    async def safe_send(self, data):
+        await self.wait_written(self.queue_send(data))
+
+    def queue_command(self, cmd, opt=None):
         if opt is not None:
             packet = bytes([Telnet.IAC, cmd, opt])
         else:
             packet = bytes([Telnet.IAC, cmd])
-        await self.safe_send(packet)
+        return self.queue_send(packet)
 
-    async def send_subnegotiation(self, opt, data: bytes):
+    async def send_command(self, cmd, opt=None):
+        await self.wait_written(self.queue_command(cmd, opt))
+
+    def queue_subnegotiation(self, opt, data: bytes):
         packet = bytes([Telnet.IAC, Telnet.SB, opt]) + \
                  self.escape_iac(data) + \
                  bytes([Telnet.IAC, Telnet.SE])
-        await self.safe_send(packet)
+        return self.queue_send(packet)
 
-    async def send_text(self, text: str, transliterate: bool = True):
+    async def send_subnegotiation(self, opt, data: bytes):
+        await self.wait_written(self.queue_subnegotiation(opt, data))
+
+    def queue_text(self, text: str, transliterate: bool = True):
         if TRANSLITERATE and transliterate:
             text = transliterate_emojis(text)
         data = text.encode(self.encoding, errors='ignore')
-        packet = self.escape_iac(data)
-        await self.safe_send(packet)
+        return self.queue_send(self.escape_iac(data))
 
-    async def send_naws(self, width=80, height=24):
+    async def send_text(self, text: str, transliterate: bool = True):
+        await self.wait_written(self.queue_text(text, transliterate))
+
+    async def send_lines(self, lines, pacing=0.0, transliterate: bool = True):
+        """
+        Sends each line as a command. Without pacing they all go out in a
+        single write; with pacing they're spaced for MUDs that throttle input.
+        """
+        if not pacing:
+            await self.send_text("".join(line + "\n" for line in lines), transliterate)
+            return
+        for i, line in enumerate(lines):
+            if i:
+                await asyncio.sleep(pacing)
+            if self.write_closed:
+                return
+            await self.send_text(line + "\n", transliterate)
+
+    def queue_naws(self, width=80, height=24):
         if not (NAWS_MIN <= width <= NAWS_MAX) or not (NAWS_MIN <= height <= NAWS_MAX):
             raise ValueError(f"Terminal dimensions must be between {NAWS_MIN} and {NAWS_MAX}")
 
         w_hi, w_lo = divmod(width, 256)
         h_hi, h_lo = divmod(height, 256)
         data = bytes([w_hi, w_lo, h_hi, h_lo])
-        await self.send_subnegotiation(Telnet.NAWS, data)
+        return self.queue_subnegotiation(Telnet.NAWS, data)
+
+    async def send_naws(self, width=80, height=24):
+        await self.wait_written(self.queue_naws(width, height))
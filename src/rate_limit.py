@@ -0,0 +1,190 @@
+import asyncio
+import time
+from collections import deque
+
+class RateLimiter:
+    """
+    Token bucket mirroring a Discord rate-limit bucket.
+    Starts from the documented limit and is corrected by the rate-limit headers
+    and retry_after values Discord returns.
+    """
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.tokens = float(limit)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.limit, self.tokens + elapsed * self.limit / self.per)
+            self.updated = now
+
+    def delay(self):
+        """Seconds until a token is available."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) * self.per / self.limit)
+        return wait
+
+    async def acquire(self):
+        while True:
+            wait = self.delay()
+            if wait <= 0:
+                self.tokens -= 1
+                return
+            await asyncio.sleep(wait)
+
+    def backoff(self, retry_after):
+        """Blocks the bucket after a 429."""
+        now = time.monotonic()
+        self.tokens = 0.0
+        self.updated = now
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+    def update_from_headers(self, headers):
+        """Applies X-RateLimit-* headers from a Discord response."""
+        try:
+            limit = headers.get('X-RateLimit-Limit')
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset_after = headers.get('X-RateLimit-Reset-After')
+            if limit is not None:
+                self.limit = max(1, int(limit))
+            if remaining is not None:
+                self.tokens = float(remaining)
+                self.updated = time.monotonic()
+            if reset_after is not None and remaining is not None and int(remaining) == 0:
+                self.backoff(float(reset_after))
+        except (TypeError, ValueError):
+            pass
+
+def get_retry_after(exc, default):
+    """Extracts retry_after from a discord.py 429 exception."""
+    retry_after = getattr(exc, 'retry_after', None)
+    if retry_after is not None:
+        return float(retry_after)
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        try:
+            return float(headers.get('Retry-After') or headers.get('X-RateLimit-Reset-After') or default)
+        except (TypeError, ValueError):
+            pass
+    return default
+
+class SendScheduler:
+    """
+    Bot-wide gate for Discord sends.
+    Enforces the global request rate and hands out slots to sessions with
+    deficit round-robin, so one flooding session only gets its weighted share.
+    Sessions usually wait on one send at a time, so a key keeps its place and
+    any unused share until its next turn; a request made while it still has
+    share left is served ahead of the rest of the round.
+    """
+    def __init__(self, limit, per):
+        self.limiter = RateLimiter(limit, per)
+        self.active = deque()  # Keys served this round or waiting, in service order
+        self.waiters = {}      # {key: deque of futures}, for every key in active
+        self.weights = {}      # {key: share relative to the default of 1}
+        self.deficits = {}     # {key: sends left in its current turn}
+        self.wakeup = None
+        self.task = None
+
+    async def acquire(self, key):
+        """Waits until key may make one Discord request."""
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiters.get(key)
+        if queue is None:
+            queue = self.waiters[key] = deque()
+            self.active.append(key)
+        elif not queue and self.deficits.get(key, 0) >= 1:
+            # Still has share left this round; use it before moving on
+            self.active.remove(key)
+            self.active.appendleft(key)
+        queue.append(future)
+        self.wakeup.set()
+        await future
+
+    def set_weight(self, key, weight):
+        if weight <= 0:
+            raise ValueError("Weight must be positive")
+        self.weights[key] = weight
+
+    def remove(self, key):
+        """Forgets a session, releasing anything it still has queued."""
+        self.weights.pop(key, None)
+        self.deficits.pop(key, None)
+        queue = self.waiters.pop(key, None)
+        if queue is not None:
+            for future in queue:
+                future.cancel()
+            if key in self.active:
+                self.active.remove(key)
+
+    def backoff(self, retry_after):
+        """Pauses all sends after a global 429."""
+        self.limiter.backoff(retry_after)
+
+    async def _run(self):
+        try:
+            while True:
+                if not any(self.waiters.values()):
+                    # Idle: the round is over and unused shares lapse
+                    self.waiters.clear()
+                    self.active.clear()
+                    self.deficits.clear()
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                # Take the slot before choosing a key, so one that asks again
+                # meanwhile can still use the rest of its share
+                await self.limiter.acquire()
+                self._grant()
+        except asyncio.CancelledError:
+            pass
+
+    def _grant(self):
+        """Gives one send slot to the key whose turn it is."""
+        while self.active:
+            key = self.active[0]
+            queue = self.waiters[key]
+            while queue and queue[0].done():
+                queue.popleft()
+            if not queue:
+                # Nothing asked for since its last turn; unused share lapses
+                self.active.popleft()
+                del self.waiters[key]
+                self.deficits.pop(key, None)
+                continue
+
+            deficit = self.deficits.get(key, 0)
+            if deficit < 1:
+                deficit += self.weights.get(key, 1)
+                if deficit < 1:
+                    self.deficits[key] = deficit
+                    self.active.rotate(-1)
+                    continue
+
+            queue.popleft().set_result(None)
+            self.deficits[key] = deficit - 1
+            if deficit < 2 or not queue:
+                # Turn over, or waiting on its next request; acquire() moves it back up
+                self.active.rotate(-1)
+            return
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for queue in self.waiters.values():
+            for future in queue:
+                future.cancel()
+        self.waiters.clear()
+        self.active.clear()
+        self.deficits.clear()
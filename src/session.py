@@ -1,8 +1,17 @@
 import asyncio
+import io
+import time
 import discord
-from .config import MAX_BUFFER_SIZE, SESSION_CLOSE_TIMEOUT
+from .config import MAX_BUFFER_SIZE, BUFFER_LOW_WATER, SESSION_CLOSE_TIMEOUT, CHANNEL_RATE_LIMIT, CHANNEL_RATE_PERIOD, GLOBAL_RATE_LIMIT, GLOBAL_RATE_PERIOD, INTERACTIVE_SEND_WEIGHT, FLUSH_DEADLINE, FLUSH_SIZE, EDIT_APPEND, EDIT_APPEND_MAX_AGE, EDIT_INTERVAL, SPILL_THRESHOLD, SPILL_TAIL_LINES, MINIMIZE_OUTPUT, HANDOFF_FLUSH_TIMEOUT, GMCP_PING_INTERVAL, HEARTBEAT_TICK, HEARTBEAT_SLOTS
 from .protocol import TelnetProtocol
-from .utils import extract_urls
+from .output_buffer import OutputBuffer
+from .minimizer import OutputMinimizer
+from .triggers import TriggerEngine
+from .aliases import AliasExpander
+from .connection import remember_tls_session
+from .rate_limit import RateLimiter, SendScheduler, get_retry_after
+from .timer_wheel import TimerWheel
+from .utils import extract_urls, ANSI_STRIP_RE
 
 class MudSession:
     def __init__(self, manager, user_id, reader, writer, channel, username):
@@ -13,98 +22,259 @@ class MudSession:
         self.writer = writer
         self.channel = channel
         self.username = username
+        self.url = None
         self.protocol = TelnetProtocol(self.client, writer, user_id, username, session=self)
         self.echo_off = False
         self.bell_pending = False
-        self.buffer = ""
+        self.buffer = OutputBuffer()
+        self.minimizer = OutputMinimizer() if MINIMIZE_OUTPUT else None
+        self.triggers = manager.get_triggers(user_id)
+        self.triggers.reset()
+        self.aliases = manager.get_aliases(user_id)
+        self.input_lock = asyncio.Lock() # Keeps paced input in order
+        self.upload_task = None
         self.msg_queue = asyncio.Queue()
-        self.activity_event = asyncio.Event()
+        self.drained_event = asyncio.Event()
+        self.last_activity = time.monotonic()
+        self.rate_limiter = RateLimiter(CHANNEL_RATE_LIMIT, CHANNEL_RATE_PERIOD)
+        # Last output message, kept for EDIT_APPEND
+        self.last_message = None
+        self.last_message_body = ""
+        self.last_message_urls = []
+        self.last_message_time = 0.0
+        self.last_edit_time = 0.0
+        self.last_separator = ""
         self.worker_task = asyncio.create_task(self.worker())
-        self.heartbeat_task = asyncio.create_task(self.gmcp_heartbeat())
         self.listener_task = None
+        manager.heartbeats.schedule(self, GMCP_PING_INTERVAL)
 
-    def notify_activity(self):
-        self.activity_event.set()
-        self.activity_event.clear()
+    def consume_buffer(self, n):
+        """
+        Drops the first n characters of pending output once they have been sent.
+        Returns the number of newlines stripped after them.
+        """
+        self.buffer.consume(n)
+        stripped = self.buffer.lstrip('\n')
+        if len(self.buffer) <= BUFFER_LOW_WATER:
+            self.drained_event.set()
+        return stripped
 
-    async def gmcp_heartbeat(self):
-        try:
-            while True:
-                try:
-                    await asyncio.wait_for(self.activity_event.wait(), timeout=45.0)
-                except asyncio.TimeoutError:
-                    if self.protocol and self.protocol.gmcp.enabled:
-                        await self.protocol.gmcp.send("Core.Ping", self.protocol.gmcp.last_rtt)
-                except Exception as e:
-                    self.client.log_event(self.user_id, self.username, f"Heartbeat error: {e}")
-                    await asyncio.sleep(5)
-        except asyncio.CancelledError:
-            pass
+    def appendable_message(self):
+        """Returns the last output message if new output can be edited into it."""
+        if not EDIT_APPEND or not self.last_message or self.bell_pending:
+            return None
+        now = asyncio.get_running_loop().time()
+        if now - self.last_message_time > EDIT_APPEND_MAX_AGE:
+            return None
+        # Only extend it while nothing (e.g. the player's input) was posted after it
+        if getattr(self.channel, 'last_message_id', None) != self.last_message.id:
+            return None
+        if len(self.last_message_body) > 1900 - 500:
+            return None
+        return self.last_message
+
+    def format_message(self, body, urls, mention, header=""):
+        """Builds message content, returning it with any links that did not fit."""
+        # Chunks without escapes don't need the ansi highlighter
+        fence = "```" if self.minimizer and '\x1b' not in body else "```ansi"
+        content = f"{header}{fence}\n{body}\n```{mention}"
+        length = len(content)
+        links = []
+        overflow_links = []
+        # Add links one by one as long as we stay under the limit
+        for url in urls:
+            new_link = f"\n🔗 {url}"
+            if length + len(new_link) < 1995:
+                links.append(new_link)
+                length += len(new_link)
+            else:
+                overflow_links.append(url)
+        return content + "".join(links), overflow_links
+
+    async def spill_buffer(self, mention):
+        """Sends the whole backlog as a single text attachment plus a short inline tail."""
+        text = str(self.buffer)
+        plain = ANSI_STRIP_RE.sub('', text)
+
+        end = len(text.rstrip('\n'))
+        tail = "\n".join(text[:end].split('\n')[-SPILL_TAIL_LINES:])
+        if len(tail) > 1000:
+            # Start on a line boundary, or failing that outside any escape sequence
+            start = end - 1000
+            newline = text.find('\n', start, end)
+            start = newline + 1 if newline != -1 else self.buffer.escape_boundary(start)
+            tail = text[start:end]
+        header = f"📄 *{len(plain)} characters of output attached.*\n"
+        content, overflow_links = self.format_message(tail, extract_urls(tail), mention, header=header)
+
+        await self.acquire_send()
+        file = discord.File(io.BytesIO(plain.encode('utf-8')), filename="output.txt")
+        await self.channel.send(content, file=file)
+        # Attachment messages are never extended with EDIT_APPEND
+        self.last_message = None
+        self.bell_pending = False
+        self.consume_buffer(len(text))
+        await self.send_links(overflow_links)
+
+    async def send_links(self, urls):
+        """Posts links that didn't fit in an output message as follow-up messages."""
+        urls = list(urls)
+        while urls:
+            current_followup = ""
+            while urls:
+                next_line = f"🔗 {urls[0]}\n"
+                if len(current_followup) + len(next_line) < 1990:
+                    current_followup += next_line
+                    urls.pop(0)
+                else:
+                    # If even a single link is too long, we have to send it anyway
+                    # or it's just one giant link
+                    if not current_followup:
+                        current_followup = next_line[:1990] # Truncate extremely long links
+                        urls.pop(0)
+                    break
+
+            if current_followup:
+                await self.acquire_send()
+                await self.channel.send(current_followup.strip())
+                self.last_message = None
+
+    async def wait_for_drain(self):
+        """Blocks the MUD reader while pending output is above the high-water mark."""
+        while len(self.buffer) >= MAX_BUFFER_SIZE:
+            self.drained_event.clear()
+            await self.msg_queue.put(True)
+            try:
+                await asyncio.wait_for(self.drained_event.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                # The worker may have given up on a failed send; poke it again
+                pass
+
+    async def acquire_send(self):
+        """Waits for both this channel's bucket and the bot-wide scheduler."""
+        await self.rate_limiter.acquire()
+        # Players working through a long dump yield to ones with a few lines to show
+        weight = 1 if len(self.buffer) > FLUSH_SIZE else INTERACTIVE_SEND_WEIGHT
+        self.manager.scheduler.set_weight(self.user_id, weight)
+        await self.manager.scheduler.acquire(self.user_id)
+
+    def notify_activity(self):
+        # Called for every packet; the heartbeat wheel reads this lazily
+        self.last_activity = time.monotonic()
 
     async def worker(self):
         try:
             while True:
                 await self.msg_queue.get()
-                await asyncio.sleep(0.03)
+
+                # Keep batching until a message is nearly full or the deadline passes
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + FLUSH_DEADLINE
+                while len(self.buffer) < FLUSH_SIZE and not self.bell_pending:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        await asyncio.wait_for(self.msg_queue.get(), timeout=remaining)
+                    except asyncio.TimeoutError:
+                        break
                 while not self.msg_queue.empty():
                     self.msg_queue.get_nowait()
 
                 while (self.buffer or self.bell_pending) and not self.client.is_shutting_down:
-                    current_snapshot = self.buffer
+                    # Output that arrives while we wait for a token joins this message
+                    delay = self.rate_limiter.delay()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
 
-                    # Reserve space for mention and a few potential links
                     mention = f" <@{self.user_id}> 🔔" if self.bell_pending else ""
+
+                    # A large backlog goes out as one attachment instead of many messages
+                    if len(self.buffer) > SPILL_THRESHOLD:
+                        try:
+                            await self.spill_buffer(mention)
+                        except discord.HTTPException as e:
+                            if e.status != 429:
+                                break
+                            self.rate_limiter.backoff(get_retry_after(e, 5.0))
+                        except discord.RateLimited as e:
+                            self.rate_limiter.backoff(e.retry_after)
+                        except Exception: break
+                        continue
+
+                    append_to = self.appendable_message()
+                    if append_to:
+                        # Coalesce edits so a message is updated at most once per interval
+                        delay = self.last_edit_time + EDIT_INTERVAL - asyncio.get_running_loop().time()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                            append_to = self.appendable_message()
+
+                    # Reserve space for mention and a few potential links
                     reserved_for_links = 400 # Reserve some space for links
                     extra_len = len(mention) + reserved_for_links
+                    if append_to:
+                        extra_len += len(self.last_message_body) + len(self.last_separator)
 
-                    chunk, remainder = self.manager.split_buffer(current_snapshot, extra_len=extra_len)
+                    chunk, size = self.manager.split_buffer(self.buffer, extra_len=extra_len, restore_state=not append_to)
+                    if not size and not self.bell_pending:
+                        # Only an unfinished escape sequence is left; wait for the rest
+                        break
 
-                    if not chunk.strip() and not self.bell_pending:
-                        self.buffer = self.buffer[len(chunk):].lstrip('\n')
+                    if not ANSI_STRIP_RE.sub('', chunk).strip() and not self.bell_pending:
+                        self.consume_buffer(size)
                         if not self.buffer: break
                         continue
 
-                    # Extract URLs actually present in this chunk
-                    chunk_urls = extract_urls(chunk)
-                    final_links_text = ""
-                    overflow_links = []
-                    if chunk_urls:
-                        # Add links one by one as long as we stay under the limit
-                        for url in chunk_urls:
-                            new_link = f"\n🔗 {url}"
-                            if len(f"```ansi\n{chunk}\n```{mention}{final_links_text}{new_link}") < 1995:
-                                final_links_text += new_link
-                            else:
-                                overflow_links.append(url)
+                    # URLs were recorded as the text arrived; look up the ones in this chunk
+                    chunk_urls = self.buffer.urls_in(size)
+                    if append_to:
+                        body = self.last_message_body + self.last_separator + chunk
+                        urls = self.last_message_urls + [u for u in chunk_urls if u not in self.last_message_urls]
+                        content, overflow_links = self.format_message(body, urls, mention)
+                        if overflow_links or len(content) >= 1995:
+                            # The current message is full; start a new one
+                            self.last_message = None
+                            continue
+                    else:
+                        body = chunk
+                        urls = chunk_urls
+                        content, overflow_links = self.format_message(body, urls, mention)
 
                     try:
-                        await self.channel.send(f"```ansi\n{chunk}\n```{mention}{final_links_text}")
+                        await self.acquire_send()
+                        now = asyncio.get_running_loop().time()
+                        if append_to:
+                            try:
+                                await append_to.edit(content=content)
+                            except discord.HTTPException as e:
+                                if e.status == 429:
+                                    raise
+                                # e.g. deleted by the player; post the chunk as a new message instead
+                                self.last_message = None
+                                continue
+                        else:
+                            self.last_message = await self.channel.send(content)
+                            self.last_message_time = now
+                        self.last_edit_time = now
+                        self.last_message_body = body
+                        self.last_message_urls = urls
+                        self.bell_pending = False
+                        self.last_separator = "\n" if self.consume_buffer(size) else ""
 
                         # Handle overflow links in follow-up messages
-                        while overflow_links:
-                            current_followup = ""
-                            while overflow_links:
-                                next_url = overflow_links[0]
-                                next_line = f"🔗 {next_url}\n"
-                                if len(current_followup) + len(next_line) < 1990:
-                                    current_followup += next_line
-                                    overflow_links.pop(0)
-                                else:
-                                    # If even a single link is too long, we have to send it anyway
-                                    # or it's just one giant link
-                                    if not current_followup:
-                                        current_followup = next_line[:1990] # Truncate extremely long links
-                                        overflow_links.pop(0)
-                                    break
-
-                            if current_followup:
-                                await self.channel.send(current_followup.strip())
-                        self.bell_pending = False
-                        self.buffer = self.buffer[len(chunk):].lstrip('\n')
-                        await asyncio.sleep(0.6)
+                        await self.send_links(overflow_links)
+                    except discord.RateLimited as e:
+                        self.rate_limiter.backoff(e.retry_after)
+                        continue
                     except discord.HTTPException as e:
                         if e.status == 429:
-                            await asyncio.sleep(5)
+                            retry_after = get_retry_after(e, 5.0)
+                            if e.response is not None:
+                                self.rate_limiter.update_from_headers(e.response.headers)
+                                if e.response.headers.get('X-RateLimit-Global'):
+                                    self.manager.scheduler.backoff(retry_after)
+                            self.rate_limiter.backoff(retry_after)
                             continue
                         else: break
                     except Exception: break
@@ -113,23 +283,97 @@ class MudSession:
         except Exception as e:
             self.client.log_event(self.user_id, self.username, f"Worker error: {e}")
 
+    async def detach(self):
+        """
+        Stops reading, posting and heartbeats without closing the MUD
+        connection, so its socket can be handed to a new process.
+        Returns False if pending writes didn't flush in time.
+        """
+        # Unregister first so the cancelled listener doesn't close the session
+        self.manager.sessions.pop(self.user_id, None)
+        self.manager.heartbeats.cancel(self)
+        tasks = [t for t in (self.listener_task, self.worker_task, self.upload_task) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        transport = self.writer.transport
+        transport.pause_reading()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + HANDOFF_FLUSH_TIMEOUT
+        while self.protocol.write_buffer or transport.get_write_buffer_size():
+            if loop.time() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def resume(self):
+        """Undoes detach() when a handoff fails."""
+        self.manager.sessions[self.user_id] = self
+        self.writer.transport.resume_reading()
+        self.worker_task = asyncio.create_task(self.worker())
+        self.manager.heartbeats.schedule(self, GMCP_PING_INTERVAL)
+        self.listener_task = asyncio.create_task(self.client.mud_listener(self.user_id, self.channel, self.username))
+        if self.buffer:
+            self.msg_queue.put_nowait(True)
+
     def stop(self):
         if self.worker_task:
             self.worker_task.cancel()
-        if self.heartbeat_task:
-            self.heartbeat_task.cancel()
+        self.manager.heartbeats.cancel(self)
+        if self.upload_task:
+            self.upload_task.cancel()
         if self.listener_task and self.listener_task != asyncio.current_task():
             self.listener_task.cancel()
+        self.protocol.close()
 
 class SessionManager:
     def __init__(self, client):
         self.client = client
         self.sessions = {}  # {user_id: MudSession}
         self.connecting = set()
+        self.scheduler = SendScheduler(GLOBAL_RATE_LIMIT, GLOBAL_RATE_PERIOD)
+        self.heartbeats = TimerWheel(HEARTBEAT_TICK, HEARTBEAT_SLOTS, self.check_idle)
+        self.triggers = {}  # {user_id: TriggerEngine}, kept across sessions
+        self.aliases = {}   # {user_id: AliasExpander}, kept across sessions
 
     def get(self, user_id):
         return self.sessions.get(user_id)
 
+    def stop(self):
+        """Stops the shared send scheduler and heartbeat wheel once every session is closed."""
+        self.scheduler.stop()
+        self.heartbeats.stop()
+
+    def check_idle(self, session):
+        """Pings GMCP sessions that have been quiet for GMCP_PING_INTERVAL."""
+        if self.sessions.get(session.user_id) is not session:
+            return
+        idle = time.monotonic() - session.last_activity
+        if idle < GMCP_PING_INTERVAL:
+            # Active since it was filed; check again when it could be due
+            self.heartbeats.schedule(session, GMCP_PING_INTERVAL - idle)
+            return
+        gmcp = session.protocol.gmcp
+        if gmcp.enabled:
+            try:
+                gmcp.queue("Core.Ping", gmcp.last_rtt)
+            except Exception as e:
+                self.client.log_event(session.user_id, session.username, f"Heartbeat error: {e}")
+        self.heartbeats.schedule(session, GMCP_PING_INTERVAL)
+
+    def get_triggers(self, user_id):
+        engine = self.triggers.get(user_id)
+        if engine is None:
+            engine = self.triggers[user_id] = TriggerEngine()
+        return engine
+
+    def get_aliases(self, user_id):
+        expander = self.aliases.get(user_id)
+        if expander is None:
+            expander = self.aliases[user_id] = AliasExpander()
+        return expander
+
     def is_connecting(self, user_id):
         return user_id in self.connecting
 
@@ -151,9 +395,12 @@ class SessionManager:
             session.stop()
         except Exception as e:
             self.client.log_event(user_id, session.username, f"Error stopping worker: {e}")
+        self.scheduler.remove(user_id)
 
         try:
             if session.writer:
+                # Pick up any session ticket issued after the handshake
+                remember_tls_session(session.writer)
                 session.writer.close()
                 try:
                     await asyncio.wait_for(session.writer.wait_closed(), timeout=SESSION_CLOSE_TIMEOUT)
@@ -164,28 +411,31 @@ class SessionManager:
         except Exception as e:
             self.client.log_event(user_id, session.username, f"Error during writer.close: {e}")
 
+        if session.minimizer:
+            self.client.log_event(user_id, session.username, f"Output minimizer saved {session.minimizer.saved} characters.")
+
+        ratio = session.protocol.compression_ratio
+        if ratio is not None:
+            self.client.log_event(user_id, session.username, f"MCCP: {session.protocol.compressed_bytes} bytes received, {session.protocol.decompressed_bytes} inflated (ratio {ratio:.1f}x).")
+
         self.client.log_event(user_id, session.username, "Session cleanup complete.")
 
-    def split_buffer(self, buf, extra_len=0):
+    def split_buffer(self, buf, extra_len=0, restore_state=True):
+        """
+        Returns (chunk, size): the next chunk of an OutputBuffer that fits in one
+        message and how many buffered characters it covers. Unless restore_state
+        is False, the chunk starts with the SGR state in effect at its start.
+        """
+        prefix = buf.state_prefix() if restore_state else ""
         # Ensure limit is at least a reasonable minimum (e.g., 500) to avoid infinite loops
         # and stay within Discord's 2000 character limit.
-        limit = max(500, 1900 - extra_len)
+        limit = max(500, 1900 - extra_len - len(prefix))
         if len(buf) <= limit:
-            return buf, ""
-
-        split_at = buf.rfind('\n', 0, limit)
-        if split_at == -1 or split_at < 500:
-            split_at = limit
-
-        last_esc = buf.rfind('\x1b', 0, split_at)
-        if last_esc != -1:
-            terminated = False
-            for j in range(last_esc + 1, min(split_at + 10, len(buf))):
-                if 0x40 <= ord(buf[j]) <= 0x7E:
-                    if j < split_at:
-                        terminated = True
-                    break
-            if not terminated:
-                split_at = last_esc
+            split_at = len(buf)
+        else:
+            split_at = buf.last_newline(500, limit)
+            if split_at == -1:
+                split_at = limit
 
-        return buf[:split_at], buf[split_at:].lstrip('\n')
+        split_at = buf.escape_boundary(split_at)
+        return prefix + buf.peek(split_at), split_at
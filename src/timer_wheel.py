@@ -0,0 +1,76 @@
+import asyncio
+import math
+
+class TimerWheel:
+    """
+    Hashed timer wheel shared by all sessions.
+    Items are filed into one of `slots` buckets, each `tick` seconds wide, and
+    a single task calls on_expire(item) as the wheel turns past their bucket.
+    Delays longer than one turn land in the last bucket; on_expire is expected
+    to reschedule anything that isn't due yet.
+    """
+    def __init__(self, tick, slots, on_expire):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.on_expire = on_expire
+        self.position = 0
+        self.scheduled = {}  # {item: slot index}
+        self.wakeup = None
+        self.task = None
+
+    def schedule(self, item, delay):
+        """Files item to expire after roughly delay seconds, replacing any earlier timer."""
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+        self.cancel(item)
+        ticks = min(max(1, math.ceil(delay / self.tick)), len(self.slots) - 1)
+        slot = (self.position + ticks) % len(self.slots)
+        self.slots[slot].add(item)
+        self.scheduled[item] = slot
+        self.wakeup.set()
+
+    def cancel(self, item):
+        slot = self.scheduled.pop(item, None)
+        if slot is not None:
+            self.slots[slot].discard(item)
+
+    def __len__(self):
+        return len(self.scheduled)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = None
+        try:
+            while True:
+                if not self.scheduled:
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    next_tick = None
+                if next_tick is None:
+                    next_tick = loop.time() + self.tick
+
+                await asyncio.sleep(max(0.0, next_tick - loop.time()))
+                # Turn by whole ticks so a late wakeup doesn't drift the wheel
+                next_tick += self.tick
+
+                self.position = (self.position + 1) % len(self.slots)
+                due = self.slots[self.position]
+                if not due:
+                    continue
+                self.slots[self.position] = set()
+                for item in due:
+                    del self.scheduled[item]
+                for item in due:
+                    self.on_expire(item)
+        except asyncio.CancelledError:
+            pass
+
+    def stop(self):
+        """Stops the wheel and forgets every pending timer."""
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        for slot in self.slots:
+            slot.clear()
+        self.scheduled.clear()
@@ -0,0 +1,217 @@
+import re
+import time
+from collections import deque
+from .config import TRIGGER_REFIRE_INTERVAL
+from .ansi_transformer import SGRState, parse_sgr_params, ANSI_SGR_RE
+from .utils import ANSI_STRIP_RE
+
+TRIGGER_ACTIONS = ('gag', 'highlight', 'send')
+
+# Discord-compatible bold, underline and yellow used for highlighted lines
+HIGHLIGHT_SEQUENCE = "\x1b[0;1;4;33m"
+
+class Trigger:
+    """A pattern matched against each completed line of MUD output."""
+    def __init__(self, pattern, action, is_regex=False, command=None):
+        if action not in TRIGGER_ACTIONS:
+            raise ValueError(f"Unknown trigger action: {action}")
+        if action == 'send' and not command:
+            raise ValueError("A send trigger needs a command")
+        if not pattern:
+            raise ValueError("Trigger pattern can't be empty")
+        self.pattern = pattern
+        self.action = action
+        self.is_regex = is_regex
+        self.command = command
+        # Validate regexes up front so a bad pattern never reaches the engine
+        self.regex = re.compile(pattern, re.IGNORECASE) if is_regex else None
+
+    def describe(self):
+        kind = "regex" if self.is_regex else "text"
+        text = f"{self.action} {kind} `{self.pattern}`"
+        if self.command:
+            text += f" → `{self.command}`"
+        return text
+
+class AhoCorasick:
+    """Finds which of many literal patterns occur in a text in a single pass."""
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self.goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][char] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(set())
+                node = next_node
+            self.outputs[node].add(index)
+
+        # Breadth-first pass to link each node to its longest proper suffix
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] |= self.outputs[self.fail[child]]
+
+    def search(self, text):
+        """Returns the set of pattern indexes found in text."""
+        found = set()
+        goto = self.goto
+        fail = self.fail
+        outputs = self.outputs
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found |= outputs[node]
+        return found
+
+class TriggerEngine:
+    """
+    Per-user gags, highlights and send-command triggers.
+    Literal patterns share one Aho-Corasick automaton and regexes share one
+    combined alternation, so each completed line is scanned once no matter
+    how many triggers there are.
+    """
+    def __init__(self):
+        self.triggers = []
+        self.compiled = None
+        self.reset()
+
+    def reset(self):
+        """Forgets per-connection state."""
+        self.partial_line = ""
+        self.held = ""
+        self.sgr = SGRState()
+        self.last_fired = {}  # {trigger: time it last sent its command}
+
+    def __bool__(self):
+        return bool(self.triggers)
+
+    @property
+    def holds_output(self):
+        """True if unterminated lines must wait, since a gag or highlight could still change them."""
+        return any(t.action != 'send' for t in self.triggers)
+
+    @property
+    def holding(self):
+        return bool(self.held)
+
+    def add(self, trigger):
+        self.triggers.append(trigger)
+        self.compiled = None
+
+    def remove(self, index):
+        trigger = self.triggers.pop(index)
+        self.last_fired.pop(trigger, None)
+        self.compiled = None
+        return trigger
+
+    def _compile(self):
+        literals = [(i, t) for i, t in enumerate(self.triggers) if not t.is_regex]
+        regexes = [(i, t) for i, t in enumerate(self.triggers) if t.is_regex]
+
+        automaton = AhoCorasick([t.pattern.lower() for _, t in literals]) if literals else None
+        combined = None
+        if regexes:
+            try:
+                combined = re.compile("|".join(f"(?:{t.pattern})" for _, t in regexes), re.IGNORECASE)
+            except re.error:
+                # e.g. numbered backreferences that shift when combined; check one by one
+                combined = None
+        self.compiled = (automaton, [i for i, _ in literals], combined, regexes)
+
+    def match(self, line):
+        """Returns the triggers that match a line of plain text."""
+        if self.compiled is None:
+            self._compile()
+        automaton, literal_ids, combined, regexes = self.compiled
+
+        matched = []
+        if automaton:
+            found = automaton.search(line.lower())
+            matched.extend(literal_ids[k] for k in sorted(found))
+        if regexes and (combined is None or combined.search(line)):
+            # Rare path: find every regex trigger on a line we know matches
+            matched.extend(i for i, t in regexes if t.regex.search(line))
+        return [self.triggers[i] for i in sorted(matched)]
+
+    def process(self, text, at_prompt=False):
+        """
+        Applies triggers to a block of output.
+        Returns (text, commands) where commands should be sent to the MUD.
+        While gags or highlights are set, an unterminated line is held back
+        until its newline arrives, the MUD marks it as a prompt (at_prompt),
+        or flush() is called; otherwise it passes through and is matched once
+        the line is complete.
+        """
+        text = self.held + text
+        self.held = ""
+        lines = text.split('\n')
+        partial = lines.pop()
+        out = []
+        commands = []
+        for raw in lines:
+            line = self.partial_line + raw
+            self.partial_line = ""
+            out.append(self._apply(raw, line, '\n', commands))
+
+        if partial:
+            if at_prompt:
+                out.append(self._apply(partial, self.partial_line + partial, '', commands))
+                self.partial_line = ""
+            elif self.holds_output:
+                self.held = partial
+            else:
+                self._track_sgr(partial)
+                self.partial_line += partial
+                out.append(partial)
+        return "".join(out), commands
+
+    def flush(self):
+        """Releases a held line as if it were a prompt, e.g. after a timeout."""
+        if not self.held:
+            return "", []
+        return self.process("", at_prompt=True)
+
+    def _apply(self, raw, line, terminator, commands):
+        """Returns the output for one line; raw is its text from this block, line all of it."""
+        self._track_sgr(raw)
+        plain = ANSI_STRIP_RE.sub('', line)
+        actions = set()
+        now = time.monotonic()
+        for trigger in self.match(plain):
+            actions.add(trigger.action)
+            if trigger.action == 'send':
+                # Don't fire on the command's own echo, or loop on output it causes
+                if trigger.command.lower() in plain.lower():
+                    continue
+                if now - self.last_fired.get(trigger, float('-inf')) < TRIGGER_REFIRE_INTERVAL:
+                    continue
+                self.last_fired[trigger] = now
+                commands.append(trigger.command)
+
+        if 'gag' in actions:
+            # Keep escape sequences so colour state stays consistent downstream
+            return "".join(m.group() for m in ANSI_SGR_RE.finditer(raw))
+        if 'highlight' in actions:
+            restore = self.sgr.get_sequence(prev_state=SGRState())
+            return f"{HIGHLIGHT_SEQUENCE}{ANSI_STRIP_RE.sub('', raw)}\x1b[0m{restore}{terminator}"
+        return raw + terminator
+
+    def _track_sgr(self, text):
+        for match in ANSI_SGR_RE.finditer(text):
+            self.sgr.apply_params(parse_sgr_params(match.group(1)))
@@ -0,0 +1,71 @@
+import codecs
+import contextlib
+import time
+import aiohttp
+from .config import UPLOAD_CHUNK_SIZE, UPLOAD_MAX_LINE, UPLOAD_PROGRESS_INTERVAL
+from .rate_limit import RateLimiter
+
+def split_long_line(line):
+    return [line[i:i + UPLOAD_MAX_LINE] for i in range(0, len(line), UPLOAD_MAX_LINE)] or [""]
+
+async def iter_line_batches(url, encoding='utf-8'):
+    """
+    Streams a text file over HTTP and yields the complete lines found in each
+    chunk, so memory use doesn't depend on the file size. Lines longer than
+    UPLOAD_MAX_LINE are split.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ""
+    async with aiohttp.ClientSession() as http:
+        async with http.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(UPLOAD_CHUNK_SIZE):
+                lines = (pending + decoder.decode(chunk)).split('\n')
+                pending = lines.pop()
+                while len(pending) > UPLOAD_MAX_LINE:
+                    lines.append(pending[:UPLOAD_MAX_LINE])
+                    pending = pending[UPLOAD_MAX_LINE:]
+                if lines:
+                    yield [part for line in lines for part in split_long_line(line.rstrip('\r'))]
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield [pending.rstrip('\r')]
+
+class Upload:
+    """
+    Sends a text attachment to the MUD line by line.
+    Every write waits for the socket to drain, and lines_per_second (0 for
+    no limit) spaces them for MUDs that throttle input.
+    """
+    def __init__(self, session, attachment, lines_per_second):
+        self.session = session
+        self.attachment = attachment
+        self.lines_per_second = lines_per_second
+        self.lines_sent = 0
+        self.last_progress = 0.0
+
+    async def run(self, on_progress):
+        """Uploads the file, awaiting on_progress(lines_sent) every UPLOAD_PROGRESS_INTERVAL."""
+        protocol = self.session.protocol
+        limiter = RateLimiter(self.lines_per_second, 1.0) if self.lines_per_second else None
+        # aclosing() shuts the HTTP session down even when we stop early
+        async with contextlib.aclosing(iter_line_batches(self.attachment.url)) as batches:
+            async for lines in batches:
+                # Typed input waits for the batch rather than landing inside it
+                async with self.session.input_lock:
+                    if limiter:
+                        for line in lines:
+                            await limiter.acquire()
+                            await protocol.send_text(line + "\n")
+                            self.lines_sent += 1
+                    else:
+                        # Unpaced: one write per chunk, still waiting for each drain
+                        await protocol.send_text("".join(line + "\n" for line in lines))
+                        self.lines_sent += len(lines)
+                if protocol.write_closed:
+                    return
+
+                now = time.monotonic()
+                if now - self.last_progress >= UPLOAD_PROGRESS_INTERVAL:
+                    self.last_progress = now
+                    await on_progress(self.lines_sent)
@@ -2,9 +2,33 @@ import urllib.parse
 import os
 import subprocess
 import re
+from functools import lru_cache
 
 ANSI_STRIP_RE = re.compile(r'\x1b\[[\d;:]*m')
 
+# Basic URL regex: http(s) followed by non-whitespace.
+# A newline inside a URL is treated as line wrapping when it sits between
+# URL-safe characters (no space); the end-of-line check excludes . and / to
+# avoid false positives and properly handle punctuation.
+URL_EOL_CHARS = r'a-zA-Z0-9_\-?=&%#+@~'
+URL_START_CHARS = r'a-zA-Z0-9/_.\-?=&%#+@~'
+URL_RE = re.compile(rf'https?://(?:[^\s<>"]|(?<=[{URL_EOL_CHARS}])\n(?=[{URL_START_CHARS}]))+')
+
+def clean_url(url):
+    """Removes line wrapping and trailing sentence punctuation from a URL match."""
+    url = url.replace('\n', '')
+    # Trim trailing punctuation that is likely not part of the URL
+    # but part of the surrounding sentence.
+    # Note: We keep trailing ) if there was a corresponding ( in the URL
+    # to support Wikipedia style URLs.
+    while url and url[-1] in ".,!?;:]}'":
+        url = url[:-1]
+
+    if url and url.endswith(')'):
+        if url.count('(') < url.count(')'):
+            url = url[:-1]
+    return url
+
 def extract_urls(text):
     """
     Extracts unique http/https URLs from text after stripping ANSI codes.
@@ -14,40 +38,14 @@ def extract_urls(text):
     if not text:
         return []
 
-    # Strip ANSI
     plain_text = ANSI_STRIP_RE.sub('', text)
 
-    # Heuristic to heal wrapped URLs:
-    # If a line ends with URL-safe chars and the next line starts with them (no space), join them.
-    # URL-safe characters for our purposes (excluding terminal punctuation)
-    # We exclude . and / from the end-of-line check to avoid false positives
-    # and properly handle punctuation.
-    eol_chars = r'[a-zA-Z0-9_\-?=&%#+@~]'
-    start_chars = r'[a-zA-Z0-9/_.\-?=&%#+@~]'
-    wrapped_pattern = re.compile(f'({eol_chars})\n({start_chars})')
-    plain_text = wrapped_pattern.sub(r'\1\2', plain_text)
-
-    # Basic URL regex: http(s) followed by non-whitespace
-    # We use a non-greedy match and then trim common trailing punctuation
-    matches = re.findall(r'https?://[^\s<>"]+', plain_text)
-
-    unique_urls = []
-    for url in matches:
-        # Trim trailing punctuation that is likely not part of the URL
-        # but part of the surrounding sentence.
-        # Note: We keep trailing ) if there was a corresponding ( in the URL
-        # to support Wikipedia style URLs.
-        while url and url[-1] in ".,!?;:]}'":
-            url = url[:-1]
-
-        if url and url.endswith(')'):
-            if url.count('(') < url.count(')'):
-                url = url[:-1]
-
-        if url and url not in unique_urls:
-            unique_urls.append(url)
-
-    return unique_urls
+    unique_urls = {}
+    for match in URL_RE.finditer(plain_text):
+        url = clean_url(match.group())
+        if url:
+            unique_urls[url] = None
+    return list(unique_urls)
 
 def get_version():
     """
@@ -144,6 +142,39 @@ EMOJI_MAP = {
     "👎": "-1"
 }
 
+# Stripped before matching: Variation Selector-16 (U+FE0F), which Discord often
+# appends, and skin tone modifiers (U+1F3FB to U+1F3FF) to prevent dangling bytes
+EMOJI_STRIP_CHARS = "\ufe0f" + "".join(chr(i) for i in range(0x1f3fb, 0x1f400))
+EMOJI_STRIP_TABLE = {ord(c): None for c in EMOJI_STRIP_CHARS}
+
+def register_emoji(target, replacement):
+    """Adds or overrides an EMOJI_MAP entry."""
+    EMOJI_MAP[target] = replacement
+    build_emoji_tables.cache_clear()
+
+@lru_cache(maxsize=1)
+def build_emoji_tables():
+    """
+    Compiles EMOJI_MAP into a str.translate table for single-character targets,
+    plus one alternation regex for any multi-character ones.
+    Returns (table, multi_map, multi_re, ascii_targets).
+    """
+    table = dict(EMOJI_STRIP_TABLE)
+    multi_map = {}
+    for target, replacement in EMOJI_MAP.items():
+        target = target.translate(EMOJI_STRIP_TABLE)
+        if len(target) == 1:
+            table[ord(target)] = replacement
+        elif target:
+            multi_map[target] = replacement
+
+    multi_re = None
+    if multi_map:
+        targets = sorted(multi_map, key=len, reverse=True)
+        multi_re = re.compile("|".join(re.escape(t) for t in targets))
+    ascii_targets = any(t.isascii() for t in multi_map)
+    return table, multi_map, multi_re, ascii_targets
+
 def transliterate_emojis(text):
     """
     Transliterates common emojis and shortcodes into equivalent ASCII smileys.
@@ -152,14 +183,11 @@ def transliterate_emojis(text):
     if not text:
         return text
 
-    # Strip Variation Selector-16 (U+FE0F) which Discord often appends
-    text = text.replace("\ufe0f", "")
-
-    # Strip skin tone modifiers (U+1F3FB to U+1F3FF) to prevent dangling bytes
-    for i in range(0x1f3fb, 0x1f400):
-        text = text.replace(chr(i), "")
-
-    for target, replacement in EMOJI_MAP.items():
-        text = text.replace(target, replacement)
+    table, multi_map, multi_re, ascii_targets = build_emoji_tables()
+    if text.isascii() and not ascii_targets:
+        return text
 
+    text = text.translate(table)
+    if multi_re:
+        text = multi_re.sub(lambda m: multi_map[m.group()], text)
     return text
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from src.aliases import AliasExpander
+from src.config import MAX_EXPANDED_COMMANDS
+
+
+def test_plain_input_passes_through():
+    assert AliasExpander().expand("say hello  there") == ["say hello  there"]
+
+
+def test_multiline_input_is_one_command_per_line():
+    assert AliasExpander().expand("look\n\nscore") == ["look", "", "score"]
+
+
+def test_speedwalk():
+    assert AliasExpander().expand(".2n3e1sw") == ["n", "n", "e", "e", "e", "sw"]
+
+
+def test_words_made_of_directions_are_not_speedwalks():
+    assert AliasExpander().expand("news") == ["news"]
+    assert AliasExpander().expand("2nd") == ["2nd"]
+    assert AliasExpander().expand("say 2nd") == ["say 2nd"]
+
+
+def test_speedwalk_steps_without_counts():
+    assert AliasExpander().expand(".nnwu") == ["n", "nw", "u"]
+
+
+def test_repeat():
+    assert AliasExpander().expand("#3 kill rat") == ["kill rat"] * 3
+
+
+def test_alias_arguments_and_separators():
+    expander = AliasExpander()
+    expander.add("ga", "get all $1; wear all")
+    assert expander.expand("ga corpse") == ["get all corpse", "wear all"]
+
+
+def test_alias_star_argument():
+    expander = AliasExpander()
+    expander.add("t", "tell bob $*")
+    assert expander.expand("t hi there") == ["tell bob hi there"]
+
+
+def test_self_referencing_alias_stops():
+    expander = AliasExpander()
+    expander.add("x", "x")
+    assert expander.expand("x") == ["x"]
+
+
+def test_alias_names_are_validated():
+    with pytest.raises(ValueError):
+        AliasExpander().add("two words", "look")
+
+
+def test_huge_speedwalk_is_rejected_without_building_it():
+    start = time.monotonic()
+    with pytest.raises(ValueError):
+        AliasExpander().expand(".150000000n")
+    assert time.monotonic() - start < 0.1
+
+
+def test_speedwalk_cap_counts_earlier_commands():
+    count = MAX_EXPANDED_COMMANDS - 1
+    with pytest.raises(ValueError):
+        AliasExpander().expand(f"look\nlook\n.{count}n")
+
+
+def test_speedwalk_up_to_cap_is_allowed():
+    assert len(AliasExpander().expand(f".{MAX_EXPANDED_COMMANDS}n")) == MAX_EXPANDED_COMMANDS
+
+
+def test_huge_repeat_is_rejected():
+    with pytest.raises(ValueError):
+        AliasExpander().expand("#99999999999999999999 look")
+
+
+def test_overlong_count_raises_value_error():
+    with pytest.raises(ValueError):
+        AliasExpander().expand("." + "9" * 5000 + "n")
@@ -0,0 +1,207 @@
+import asyncio
+import socket
+import ssl
+
+import pytest
+import websockets
+
+from src import connection
+
+
+class Awaitable:
+    """Stands in for websockets' Connect object, which isn't a coroutine."""
+    def __init__(self, result, delay=0.0):
+        self.result = result
+        self.delay = delay
+
+    def __await__(self):
+        return self._wait().__await__()
+
+    async def _wait(self):
+        await asyncio.sleep(self.delay)
+        return self.result
+
+
+def test_race_accepts_non_coroutine_awaitables():
+    result = asyncio.run(connection.race_attempts([lambda: Awaitable("ws")], 0.01, lambda r: None))
+    assert result == "ws"
+
+
+def test_race_skips_stalled_attempt():
+    async def main():
+        stalled = asyncio.Event()
+        async def never():
+            await stalled.wait()
+        async def quick():
+            return "second"
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await connection.race_attempts([never, quick], 0.05, lambda r: None)
+        return result, loop.time() - start
+    result, elapsed = asyncio.run(main())
+    assert result == "second"
+    assert elapsed < 1.0
+
+
+def test_race_starts_next_attempt_on_failure():
+    async def refused():
+        raise ConnectionRefusedError()
+    async def ok():
+        return "ok"
+    # A long stagger shows the second attempt started because the first failed
+    assert asyncio.run(connection.race_attempts([refused, ok], 10.0, lambda r: None)) == "ok"
+
+
+def test_race_raises_last_error_when_all_fail():
+    async def refused():
+        raise ConnectionRefusedError()
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(connection.race_attempts([refused, refused], 0.01, lambda r: None))
+
+
+def test_race_raises_ssl_errors_immediately():
+    async def bad_cert():
+        raise ssl.SSLError("bad certificate")
+    async def slow():
+        await asyncio.sleep(10)
+    with pytest.raises(ssl.SSLError):
+        asyncio.run(connection.race_attempts([bad_cert, slow], 0.01, lambda r: None))
+
+
+def test_race_discards_extra_winners():
+    discarded = []
+    async def main():
+        go = asyncio.Event()
+        async def attempt(name):
+            await go.wait()
+            return name
+        asyncio.get_running_loop().call_later(0.05, go.set)
+        # Both attempts are running when go is set, so both succeed at once
+        return await connection.race_attempts(
+            [lambda: attempt("first"), lambda: attempt("second")], 0.0, discarded.append)
+    winner = asyncio.run(main())
+    assert discarded == [{"first", "second"}.difference([winner]).pop()]
+
+
+def test_interleave_families():
+    v4a = (socket.AF_INET, ("1.1.1.1", 1))
+    v4b = (socket.AF_INET, ("1.1.1.2", 1))
+    v6 = (socket.AF_INET6, ("::1", 1))
+    assert connection.interleave_families([v4a, v4b, v6]) == [v4a, v6, v4b]
+
+
+def test_open_ws_races_websocket_connect(monkeypatch):
+    async def fake_resolve(host, port):
+        return [(socket.AF_INET, ("127.0.0.1", port))]
+    calls = []
+    def fake_connect(url, **kwargs):
+        calls.append((url, kwargs["host"]))
+        return Awaitable("websocket")
+    monkeypatch.setattr(connection, "resolve", fake_resolve)
+    monkeypatch.setattr(connection.websockets, "connect", fake_connect)
+
+    ws = asyncio.run(connection.open_ws("ws://mud.example:4000/", "mud.example", 4000, None))
+    assert ws == "websocket"
+    assert calls == [("ws://mud.example:4000/", "127.0.0.1")]
+
+
+class FakeWebSocket:
+    def __init__(self, frames, error):
+        self.frames = list(frames)
+        self.error = error
+
+    async def recv(self):
+        if self.frames:
+            return self.frames.pop(0)
+        raise self.error
+
+
+def read_all(adapter, n=1024):
+    async def main():
+        results = []
+        while True:
+            data = await adapter.read(n)
+            if not data:
+                return results
+            results.append(data)
+    return asyncio.run(main())
+
+
+def test_ws_adapter_joins_frames_of_the_same_type():
+    ws = FakeWebSocket([b"ab", b"cd", "text", b"ef"], websockets.exceptions.ConnectionClosedOK(None, None))
+    adapter = connection.WebSocketStreamAdapter(ws)
+    assert read_all(adapter) == [b"abcd", "text", b"ef"]
+
+
+def test_ws_adapter_raises_unexpected_receive_errors():
+    adapter = connection.WebSocketStreamAdapter(FakeWebSocket([b"ab"], RuntimeError("boom")))
+    async def main():
+        assert await adapter.read(1024) == b"ab"
+        with pytest.raises(RuntimeError):
+            await adapter.read(1024)
+        assert await adapter.read(1024) == b""
+    asyncio.run(main())
+
+
+def test_default_deflate_settings_match_websockets():
+    from websockets.extensions.permessage_deflate import enable_client_permessage_deflate
+    ours = vars(connection.ws_compression_options()["extensions"][0])
+    library = vars(enable_client_permessage_deflate(None)[0])
+    assert ours == library
+
+
+def test_cancelled_resolve_does_not_cancel_other_callers(monkeypatch):
+    async def slow_getaddrinfo(host, port, type):
+        await asyncio.sleep(0.1)
+        return [(socket.AF_INET, type, 6, "", ("10.0.0.1", port))]
+    async def main():
+        monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", slow_getaddrinfo)
+        impatient = asyncio.create_task(asyncio.wait_for(connection.resolve("shared.example", 23), 0.02))
+        patient = asyncio.create_task(asyncio.wait_for(connection.resolve("shared.example", 23), 5.0))
+        with pytest.raises(asyncio.TimeoutError):
+            await impatient
+        return await patient
+    try:
+        assert asyncio.run(main()) == [(socket.AF_INET, ("10.0.0.1", 23))]
+    finally:
+        connection.forget_address("shared.example", 23)
+
+
+class FakeWriter:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_tls_race_timeout_is_not_lost_while_lenient_attempt_winds_down(monkeypatch):
+    writer = FakeWriter()
+    async def fake_open_tcp(host, port, ssl_context):
+        if ssl_context is connection.get_ssl_context(verify=True):
+            return (None, writer)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            # Slow to tear down, like a TLS handshake being abandoned
+            await asyncio.sleep(0.2)
+            raise
+    monkeypatch.setattr(connection, "open_tcp", fake_open_tcp)
+
+    async def main():
+        await asyncio.wait_for(connection.open_tls_racing("mud.example", 4000, None), 0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(main())
+    assert writer.closed
+
+
+def test_tls_race_keeps_verified_stream(monkeypatch):
+    verified, lenient = FakeWriter(), FakeWriter()
+    async def fake_open_tcp(host, port, ssl_context):
+        if ssl_context is connection.get_ssl_context(verify=True):
+            return (None, verified)
+        await asyncio.sleep(0)
+        return (None, lenient)
+    monkeypatch.setattr(connection, "open_tcp", fake_open_tcp)
+    stream = asyncio.run(connection.open_tls_racing("mud.example", 4000, None))
+    assert stream[1] is verified and not verified.closed
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+from src.gmcp import GmcpHandler
+
+
+class FakeProtocol:
+    def __init__(self):
+        self.messages = []
+
+    def queue_command(self, cmd, opt):
+        pass
+
+    def queue_subnegotiation(self, opt, data):
+        self.messages.append(data.decode('utf-8'))
+        return None
+
+    async def wait_written(self, future):
+        pass
+
+
+def sent(protocol, package):
+    return [json.loads(m.split(' ', 1)[1]) for m in protocol.messages if m.split(' ', 1)[0] == package]
+
+
+def test_supports_set_lists_subscribed_modules():
+    protocol = FakeProtocol()
+    gmcp = GmcpHandler(protocol)
+    gmcp.subscribe("Char.Vitals", lambda package, data: None)
+    gmcp.subscribe("Room.Info", lambda package, data: None, version=2)
+    asyncio.run(gmcp.enable())
+    assert protocol.messages[0].startswith("Core.Hello ")
+    assert sent(protocol, "Core.Supports.Set") == [["Core 1", "Char 1", "Room 2"]]
+
+
+def test_modules_are_added_and_removed_after_enable():
+    protocol = FakeProtocol()
+    gmcp = GmcpHandler(protocol)
+    asyncio.run(gmcp.enable())
+    callback = lambda package, data: None
+    gmcp.subscribe("Char.Vitals", callback)
+    gmcp.unsubscribe("Char.Vitals", callback)
+    assert sent(protocol, "Core.Supports.Add") == [["Char 1"]]
+    assert sent(protocol, "Core.Supports.Remove") == [["Char"]]
+
+
+def test_module_stays_while_another_package_uses_it():
+    gmcp = GmcpHandler(FakeProtocol())
+    info = lambda package, data: None
+    exits = lambda package, data: None
+    gmcp.subscribe("Room.Info", info, module="Mapper")
+    gmcp.subscribe("Room.Exits", exits, module="Mapper")
+    gmcp.unsubscribe("Room.Info", info)
+    assert "Mapper" in gmcp.modules
+    gmcp.unsubscribe("Room.Exits", exits)
+    assert "Mapper" not in gmcp.modules
+
+
+def test_core_is_never_removed():
+    gmcp = GmcpHandler(FakeProtocol())
+    gmcp.unsubscribe("Core.Ping", gmcp._handle_core_ping)
+    assert "Core" in gmcp.modules
+
+
+def test_updates_are_merged_into_the_store():
+    gmcp = GmcpHandler(FakeProtocol())
+    received = []
+    gmcp.subscribe("Char.Vitals", lambda package, data: received.append((package, data)))
+    gmcp.handle(b'Char.Vitals {"hp": 10, "mp": 5}')
+    gmcp.handle(b'char.vitals {"hp": 7}')
+    assert gmcp.store["char.vitals"] == {"hp": 7, "mp": 5}
+    assert received[-1] == ("char.vitals", {"hp": 7})
+
+
+def test_unsubscribed_packages_are_not_decoded():
+    gmcp = GmcpHandler(FakeProtocol())
+    assert not gmcp.wants("Room.Info")
+    gmcp.handle(b'Room.Info {not json')
+    assert gmcp.store == {}
+
+
+def test_ping_reply_sets_round_trip_time():
+    protocol = FakeProtocol()
+    gmcp = GmcpHandler(protocol)
+    async def main():
+        await gmcp.enable()
+        gmcp.queue("Core.Ping")
+        gmcp.handle(b"Core.Ping")
+    asyncio.run(main())
+    assert gmcp.wants("core.ping")
+    assert gmcp.last_rtt is not None
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src import handoff
+from src.minimizer import OutputMinimizer
+from src.session import MudSession, SessionManager
+from src.triggers import Trigger
+
+
+class FakeClient:
+    is_shutting_down = False
+
+    def log_event(self, user_id, username, message):
+        pass
+
+
+def test_records_and_sockets_cross_a_unix_socket():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    read_end, write_end = os.pipe()
+    records = [({'type': 'session', 'user_id': 1}, write_end), ({'type': 'end'}, None)]
+    sender = threading.Thread(target=handoff.send_records, args=(left, records))
+    sender.start()
+    try:
+        received = handoff.recv_records(right)
+    finally:
+        sender.join()
+        left.close()
+        right.close()
+    os.close(write_end)
+
+    (first, fd), (last, no_fd) = received
+    assert first == {'type': 'session', 'user_id': 1}
+    assert last == {'type': 'end'} and no_fd is None
+    # The received descriptor is a working copy of the pipe's write end
+    os.write(fd, b"hi")
+    os.close(fd)
+    assert os.read(read_end, 2) == b"hi"
+    os.close(read_end)
+
+
+def test_oversized_record_is_rejected():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    left.sendall(handoff.HEADER.pack(handoff.MAX_RECORD_SIZE + 1))
+    try:
+        with pytest.raises(ValueError):
+            handoff.recv_records(right)
+    finally:
+        left.close()
+        right.close()
+
+
+def test_request_handoff_without_a_listener(tmp_path):
+    assert asyncio.run(handoff.request_handoff(str(tmp_path / "handoff.sock"))) == []
+
+
+def test_serve_and_request_handoff(tmp_path):
+    path = str(tmp_path / "handoff.sock")
+    async def main():
+        listener = handoff.bind_handoff_socket(path)
+        async def on_request(conn):
+            await asyncio.to_thread(handoff.send_records, conn, [({'type': 'end'}, None)])
+            conn.close()
+        server = asyncio.create_task(handoff.serve_handoff(listener, on_request))
+        try:
+            return await handoff.request_handoff(path)
+        finally:
+            server.cancel()
+    assert asyncio.run(main()) == [({'type': 'end'}, None)]
+
+
+def test_user_settings_round_trip():
+    old = SessionManager(FakeClient())
+    expander = old.get_aliases(7)
+    expander.add("ga", "get all")
+    expander.pacing = 0.5
+    old.get_triggers(7).add(Trigger("hungry", 'send', command="eat"))
+    state = handoff.export_user(old, 7)
+
+    new = SessionManager(FakeClient())
+    handoff.import_user(new, state)
+    assert new.get_aliases(7).expand("ga") == ["get all"]
+    assert new.get_aliases(7).pacing == 0.5
+    assert [t.describe() for t in new.get_triggers(7).triggers] == [t.describe() for t in old.get_triggers(7).triggers]
+
+
+def test_session_state_round_trip():
+    async def main():
+        manager = SessionManager(FakeClient())
+        channel = SimpleNamespace(id=42)
+        mud_side, ours = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=ours)
+        session = MudSession(manager, 1, reader, writer, channel, "tester")
+        session.url = "telnet://mud.example:4000"
+        session.protocol.feed(b"\x1b[1;31mred")
+        session.buffer.append("pending\n")
+        session.triggers.add(Trigger("gossip", 'gag'))
+        session.triggers.process("HP:100> ")
+        session.minimizer = OutputMinimizer()
+        session.minimizer.process("HP:100> ")
+        assert handoff.transfer_blocker(session) is None
+        state = handoff.export_session(session, handoff.unread_bytes(reader) + b"unread")
+        session.stop()
+
+        reader2, writer2 = await asyncio.open_connection(sock=socket.socket(fileno=os.dup(ours.fileno())))
+        restored = MudSession(manager, 1, reader2, writer2, channel, "tester")
+        restored.minimizer = OutputMinimizer()
+        handoff.import_session(restored, state)
+        unread = await reader2.readexactly(len(b"unread"))
+        result = (restored.url, str(restored.buffer), unread, restored.triggers.flush()[0], restored.minimizer.last_prompt,
+                  vars(restored.protocol.ansi_transformer.state) == vars(session.protocol.ansi_transformer.state))
+        restored.stop()
+        manager.stop()
+        writer.close()
+        writer2.close()
+        mud_side.close()
+        return result
+    url, buffered, unread, held, prompt, same_colour = asyncio.run(main())
+    assert held == "HP:100> "
+    assert prompt == "HP:100>"
+    assert url == "telnet://mud.example:4000"
+    assert buffered == "pending\n"
+    assert unread == b"unread"
+    assert same_colour
+
+
+def test_missing_acknowledgement_is_reported_as_unconfirmed():
+    left, right = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    def receive_and_hang_up():
+        handoff._recv_exact(right, handoff.HEADER.size + len(b'{"type": "end"}'))
+        right.close()
+    receiver = threading.Thread(target=receive_and_hang_up)
+    receiver.start()
+    try:
+        with pytest.raises(handoff.HandoffUnconfirmed):
+            handoff.send_records(left, [({'type': 'end'}, None)])
+    finally:
+        receiver.join()
+        left.close()
+
+
+def test_request_handoff_raises_when_the_transfer_fails(tmp_path):
+    path = str(tmp_path / "handoff.sock")
+    async def main():
+        listener = handoff.bind_handoff_socket(path)
+        async def on_request(conn):
+            conn.close()
+        server = asyncio.create_task(handoff.serve_handoff(listener, on_request))
+        try:
+            with pytest.raises(ConnectionError):
+                await handoff.request_handoff(path)
+        finally:
+            server.cancel()
+    asyncio.run(main())
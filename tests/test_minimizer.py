@@ -0,0 +1,51 @@
+from src.minimizer import OutputMinimizer
+
+
+def run(minimizer, *reads):
+    return "".join(minimizer.process(text) for text in reads)
+
+
+def test_strips_carriage_returns_and_trailing_space():
+    assert run(OutputMinimizer(), "Hello  \r\n", "World\r\n") == "Hello\nWorld\n"
+
+
+def test_trailing_space_is_kept_when_line_continues():
+    assert run(OutputMinimizer(), "a  ", " b\n") == "a   b\n"
+
+
+def test_blank_runs_collapse_across_reads():
+    assert run(OutputMinimizer(), "a\n\n", "\n\n", "\nb\n") == "a\n\nb\n"
+
+
+def test_prompt_repeated_after_empty_command_is_dropped():
+    minimizer = OutputMinimizer()
+    assert run(minimizer, "Room.\nHP:100>") == "Room.\nHP:100>"
+    minimizer.note_commands([""])
+    assert run(minimizer, "\nHP:100>") == ""
+
+
+def test_prompt_split_from_its_newline_is_dropped():
+    minimizer = OutputMinimizer()
+    run(minimizer, "HP:100>")
+    minimizer.note_commands(["", ""])
+    assert run(minimizer, "\n", "HP:100>", "\nHP:100>") == "\n"
+
+
+def test_prompt_is_kept_without_an_empty_command():
+    minimizer = OutputMinimizer()
+    run(minimizer, "HP:100>")
+    minimizer.note_commands(["look"])
+    assert run(minimizer, "\nHP:100>") == "\nHP:100>"
+
+
+def test_completed_lines_are_never_collapsed():
+    minimizer = OutputMinimizer()
+    minimizer.note_commands([""])
+    reads = ["\nA rat arrives.", "\n", "A rat arrives.", "\n"]
+    assert run(minimizer, *reads) == "\nA rat arrives.\nA rat arrives.\n"
+
+
+def test_saved_counts_dropped_characters():
+    minimizer = OutputMinimizer()
+    run(minimizer, "a \r\n")
+    assert minimizer.saved == 2
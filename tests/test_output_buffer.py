@@ -0,0 +1,80 @@
+from src.output_buffer import OutputBuffer
+
+
+def make_buffer(*parts):
+    buf = OutputBuffer()
+    for part in parts:
+        buf.append(part)
+    return buf
+
+
+def test_peek_and_consume_across_segments():
+    buf = make_buffer("hello ", "wor", "ld")
+    assert len(buf) == 11
+    assert buf.peek(8) == "hello wo"
+    buf.consume(7)
+    assert str(buf) == "orld"
+    buf.consume(100)
+    assert not buf
+    assert str(buf) == ""
+
+
+def test_lstrip_crosses_segments():
+    buf = make_buffer("\n\n", "\nrest")
+    assert buf.lstrip("\n") == 3
+    assert str(buf) == "rest"
+
+
+def test_clear():
+    buf = make_buffer("a", "b")
+    buf.clear()
+    assert len(buf) == 0
+
+
+def test_last_newline_is_relative_to_consumed_start():
+    buf = make_buffer("ab\ncd\n", "ef\ngh")
+    assert buf.last_newline(0, len(buf)) == 8
+    assert buf.last_newline(0, 8) == 5
+    buf.consume(3)
+    assert buf.last_newline(0, len(buf)) == 5
+    assert buf.last_newline(3, 5) == -1
+
+
+def test_escape_boundary_avoids_cutting_sequences():
+    buf = make_buffer("ab\x1b[1;3", "1mcd")
+    # A split inside the sequence moves back to its start, even across appends
+    assert buf.escape_boundary(5) == 2
+    assert buf.escape_boundary(2) == 2
+    assert buf.escape_boundary(9) == 9
+
+
+def test_escape_boundary_with_unfinished_sequence():
+    buf = make_buffer("ab\x1b[3")
+    assert buf.escape_boundary(4) == 2
+
+
+def test_state_prefix_restores_consumed_colour():
+    buf = make_buffer("\x1b[1;31mred\n", "\x1b[0mplain")
+    buf.consume(len("\x1b[1;31mred\n"))
+    assert "31" in buf.state_prefix()
+    buf.consume(len("\x1b[0m"))
+    assert buf.state_prefix() == ""
+
+
+def test_urls_in_counts_only_the_requested_prefix():
+    buf = make_buffer("see https://a.example/x and\n", "https://b.example/y\n")
+    first_line = len("see https://a.example/x and\n")
+    assert buf.urls_in(first_line) == ["https://a.example/x"]
+    assert buf.urls_in(len(buf)) == ["https://a.example/x", "https://b.example/y"]
+    buf.consume(first_line)
+    assert buf.urls_in(len(buf)) == ["https://b.example/y"]
+
+
+def test_url_split_across_appends_is_found_once():
+    buf = make_buffer("go to https://exa", "mple.com/page now\n")
+    assert buf.urls_in(len(buf)) == ["https://example.com/page"]
+
+
+def test_url_inside_colour_codes():
+    buf = make_buffer("\x1b[4mhttps://example.com/c\x1b[0m\n")
+    assert buf.urls_in(len(buf)) == ["https://example.com/c"]
@@ -0,0 +1,251 @@
+import asyncio
+import zlib
+
+import pytest
+
+import src.protocol as protocol_module
+from src.protocol import TelnetProtocol, AnsiLayer, CSI_MAX_LENGTH, DecompressionError
+from src.ansi_transformer import AnsiTransformer, SGRState, XTERM_256_PALETTE, XTERM_256_FG, XTERM_256_BG, map_rgb_to_discord
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = []
+
+    def log_event(self, user_id, username, message):
+        pass
+
+    async def close_session(self, user_id):
+        self.closed.append(user_id)
+
+
+class StalledWriter:
+    """A writer whose drain never finishes, like a MUD that stopped reading."""
+    def __init__(self):
+        self.data = bytearray()
+        self.draining = asyncio.Event()
+
+    def write(self, data):
+        self.data.extend(data)
+
+    async def drain(self):
+        self.draining.set()
+        await asyncio.Event().wait()
+
+
+class Writer:
+    def __init__(self):
+        self.data = bytearray()
+        self.writes = 0
+
+    def write(self, data):
+        self.data.extend(data)
+        self.writes += 1
+
+    async def drain(self):
+        pass
+
+
+def make_protocol(writer):
+    return TelnetProtocol(FakeClient(), writer, 1, "tester")
+
+
+def test_queued_sends_share_one_write():
+    async def main():
+        writer = Writer()
+        protocol = make_protocol(writer)
+        await asyncio.gather(protocol.send_text("n\n"), protocol.send_text("e\n"))
+        protocol.close()
+        return writer
+    writer = asyncio.run(main())
+    assert bytes(writer.data) == b"n\ne\n"
+    assert writer.writes == 1
+
+
+def test_send_text_escapes_iac():
+    async def main():
+        writer = Writer()
+        protocol = make_protocol(writer)
+        protocol.set_encoding("iso8859_1")
+        await protocol.send_text("\xff\n", transliterate=False)
+        protocol.close()
+        return writer
+    assert bytes(asyncio.run(main()).data) == b"\xff\xff\n"
+
+
+def test_close_during_drain_releases_senders():
+    async def main():
+        writer = StalledWriter()
+        protocol = make_protocol(writer)
+        in_flight = asyncio.create_task(protocol.send_text("look\n"))
+        await writer.draining.wait()
+        queued = asyncio.create_task(protocol.send_text("score\n"))
+        await asyncio.sleep(0)
+        protocol.close()
+        results = await asyncio.wait_for(
+            asyncio.gather(in_flight, queued, return_exceptions=True), timeout=1.0)
+        return results
+    results = asyncio.run(main())
+    assert all(isinstance(r, ConnectionError) for r in results)
+
+
+def test_send_after_close_does_not_hang():
+    async def main():
+        protocol = make_protocol(Writer())
+        protocol.close()
+        await asyncio.wait_for(protocol.send_text("look\n"), timeout=1.0)
+    asyncio.run(main())
+
+
+def test_caller_cancellation_is_not_reported_as_closed():
+    async def main():
+        writer = StalledWriter()
+        protocol = make_protocol(writer)
+        task = asyncio.create_task(protocol.send_text("look\n"))
+        await writer.draining.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        protocol.close()
+    asyncio.run(main())
+
+
+def test_go_ahead_marks_prompt():
+    protocol = make_protocol(Writer())
+    assert protocol.feed(b"HP:100> \xff\xf9") == "HP:100> "
+    assert protocol.at_prompt
+    protocol.feed(b"You are hungry.\n")
+    assert not protocol.at_prompt
+
+
+def gmcp_sb(payload):
+    return b"\xff\xfa\xc9" + payload + b"\xff\xf0"
+
+
+def test_unsubscribed_gmcp_payload_is_dropped_while_streaming():
+    protocol = make_protocol(Writer())
+    received = []
+    protocol.gmcp.subscribe("Char.Vitals", lambda package, data: received.append(data))
+    protocol.feed(b"\xff\xfa\xc9Room.Info {\"num\": ")
+    assert protocol.sb_discard == "unwanted"
+    assert protocol.sb_data == bytearray()
+    protocol.feed(b"1" * 5000 + b"}\xff\xf0" + gmcp_sb(b'Char.Vitals {"hp": 5}'))
+    assert received == [{"hp": 5}]
+    assert "room.info" not in protocol.gmcp.store
+
+
+def test_gmcp_package_name_split_across_reads():
+    protocol = make_protocol(Writer())
+    received = []
+    protocol.gmcp.subscribe("Char.Vitals", lambda package, data: received.append(data))
+    for byte in gmcp_sb(b'Char.Vitals {"hp": 7}'):
+        protocol.feed(bytes([byte]))
+    assert received == [{"hp": 7}]
+
+
+MIXED_STREAM = (
+    b"Welcome\r\n\x1b[1;31mRed\x1b[0m text\xff\xfd\x18"
+    + gmcp_sb(b'Char.Vitals {"hp": 9}')
+    + b"bell\x07 and \xff\xff literal\r\nHP:100> \xff\xf9"
+)
+
+
+def test_scan_bulk_and_bytewise_feeds_agree():
+    async def run(chunks):
+        writer = Writer()
+        protocol = make_protocol(writer)
+        received = []
+        protocol.gmcp.subscribe("Char.Vitals", lambda package, data: received.append(data))
+        text = "".join(protocol.feed(chunk) for chunk in chunks)
+        await protocol.send_text("")
+        protocol.close()
+        return text, received, bytes(writer.data), protocol.at_prompt
+    outputs = [asyncio.run(run([MIXED_STREAM])),
+               asyncio.run(run([bytes([b]) for b in MIXED_STREAM]))]
+    assert outputs[0] == outputs[1]
+    assert "Red" in outputs[0][0] and outputs[0][1] == [{"hp": 9}]
+
+
+def test_scan_stops_after_compress2_starts():
+    protocol = make_protocol(Writer())
+    start = b"before\xff\xfa\x56\xff\xf0"
+    consumed = protocol._scan(start + b"\x78\x9c")
+    assert consumed == len(start)
+    assert protocol.compressing
+
+
+def ansi_chunks(layer):
+    return [(type, bytes(content)) for type, content in layer.get_output()]
+
+
+def test_ansi_layer_joins_csi_split_across_reads():
+    layer = AnsiLayer()
+    layer.feed(b"ab\x1b")
+    layer.feed(b"[1;3")
+    layer.feed(b"1mcd")
+    assert ansi_chunks(layer) == [("TEXT", b"ab"), ("ANSI", b"\x1b[1;31m"), ("TEXT", b"cd")]
+
+
+def test_ansi_layer_gives_up_on_overlong_csi():
+    layer = AnsiLayer()
+    runaway = b"\x1b[" + b"1;" * CSI_MAX_LENGTH
+    for i in range(0, len(runaway), 5):
+        layer.feed(runaway[i:i + 5])
+    chunks = ansi_chunks(layer)
+    assert chunks[0] == ("TEXT", runaway[:CSI_MAX_LENGTH])
+    assert b"".join(content for _, content in chunks) == runaway
+    assert all(type == "TEXT" for type, _ in chunks)
+    assert layer.state == "TEXT"
+
+
+def test_ansi_transformer_emits_deltas_only_before_text():
+    transformer = AnsiTransformer()
+    assert transformer.feed("\x1b[31m") == ""
+    assert transformer.feed("\x1b[1m") == ""
+    assert transformer.feed_text("hi") == "\x1b[1;31mhi"
+    # Repeating or resetting back to the same state emits nothing
+    assert transformer.feed("\x1b[31mon\x1b[0m\x1b[1;31m") == "on"
+    assert transformer.feed_text("!") == "!"
+    assert transformer.feed("\x1b[32m") == ""
+    assert transformer.feed("\x1b[0m") == ""
+    assert transformer.flush() == "\x1b[0m"
+
+
+def test_xterm_256_tables_match_per_color_mapping():
+    assert XTERM_256_FG == [map_rgb_to_discord(rgb, False) for rgb in XTERM_256_PALETTE]
+    assert XTERM_256_BG == [map_rgb_to_discord(rgb, True) for rgb in XTERM_256_PALETTE]
+    state = SGRState()
+    state.apply_params([38, 5, 196, 48, 5, 21])
+    assert (state.fg, state.bg) == (XTERM_256_FG[196], XTERM_256_BG[21])
+    # The first eight indexes keep the plain 4-bit codes
+    state.apply_params([38, 5, 3, 48, 5, 4])
+    assert (state.fg, state.bg) == (33, 44)
+    # 24-bit colors go through the same mapping
+    state.apply_params([38, 2, 255, 0, 0])
+    assert state.fg == map_rgb_to_discord((255, 0, 0), False)
+
+
+MCCP_START = b"\xff\xfa\x56\xff\xf0"
+
+
+def test_mccp_inflates_in_bounded_slices(monkeypatch):
+    monkeypatch.setattr(protocol_module, "MCCP_CHUNK_SIZE", 1000)
+    protocol = make_protocol(Writer())
+    text = b"".join(b"line %d of the help file\r\n" % i for i in range(2000))
+    compressor = zlib.compressobj()
+    stream = MCCP_START + compressor.compress(text) + compressor.flush() + b"after\r\n"
+    scanned = []
+    scan = protocol._scan
+    protocol._scan = lambda data: scanned.append(len(data)) or scan(data)
+    output = protocol.feed(stream)
+    assert output == (text + b"after\r\n").decode()
+    assert not protocol.compressing
+    assert max(scanned[1:-1]) <= 1000 and len(scanned) > len(text) // 1000
+
+
+def test_mccp_read_expanding_past_cap_is_rejected(monkeypatch):
+    monkeypatch.setattr(protocol_module, "MCCP_MAX_EXPANSION", 10000)
+    protocol = make_protocol(Writer())
+    bomb = zlib.compress(b"\0" * 50000)
+    with pytest.raises(DecompressionError):
+        protocol.feed(MCCP_START + bomb)
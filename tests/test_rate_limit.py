@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.rate_limit import RateLimiter, SendScheduler, get_retry_after
+
+
+def test_limiter_allows_burst_then_waits():
+    limiter = RateLimiter(2, 1.0)
+    limiter.tokens -= 2
+    assert 0.4 < limiter.delay() <= 0.5
+
+
+def test_backoff_blocks_the_bucket():
+    limiter = RateLimiter(5, 5.0)
+    limiter.backoff(3.0)
+    assert limiter.delay() > 2.9
+
+
+def test_update_from_headers():
+    limiter = RateLimiter(5, 5.0)
+    limiter.update_from_headers({'X-RateLimit-Limit': '10', 'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset-After': '2.5'})
+    assert limiter.limit == 10
+    assert 2.4 < limiter.delay() <= 2.5
+
+
+def test_bad_headers_are_ignored():
+    limiter = RateLimiter(5, 5.0)
+    limiter.update_from_headers({'X-RateLimit-Limit': 'lots'})
+    assert limiter.limit == 5
+
+
+def test_get_retry_after():
+    assert get_retry_after(SimpleNamespace(retry_after=1.5), 5.0) == 1.5
+    response = SimpleNamespace(headers={'Retry-After': '2'})
+    assert get_retry_after(SimpleNamespace(response=response), 5.0) == 2.0
+    assert get_retry_after(Exception(), 5.0) == 5.0
+
+
+def test_weights_share_sends_between_one_at_a_time_senders():
+    async def main():
+        scheduler = SendScheduler(200, 1.0)
+        scheduler.limiter.tokens = 0
+        scheduler.set_weight("heavy", 3)
+        counts = {"heavy": 0, "light": 0}
+
+        async def sender(key):
+            # Like a session worker: one request waiting at a time
+            while True:
+                await scheduler.acquire(key)
+                counts[key] += 1
+                await asyncio.sleep(0)
+
+        tasks = [asyncio.create_task(sender(key)) for key in counts]
+        while sum(counts.values()) < 40:
+            await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        scheduler.stop()
+        return counts
+    counts = asyncio.run(main())
+    assert 2.5 <= counts["heavy"] / counts["light"] <= 3.5
+
+
+def test_set_weight_rejects_non_positive():
+    with pytest.raises(ValueError):
+        SendScheduler(1, 1.0).set_weight("key", 0)
+
+
+def test_remove_releases_waiters_and_forgets_key():
+    async def main():
+        scheduler = SendScheduler(1, 10.0)
+        scheduler.limiter.tokens = 0
+        waiting = [asyncio.create_task(scheduler.acquire("gone")) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        scheduler.remove("gone")
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        state = ("gone" in scheduler.waiters, "gone" in scheduler.active)
+        scheduler.stop()
+        return results, state
+    results, state = asyncio.run(main())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+    assert state == (False, False)
+
+
+def test_stop_releases_waiters():
+    async def main():
+        scheduler = SendScheduler(1, 10.0)
+        scheduler.limiter.tokens = 0
+        waiting = asyncio.create_task(scheduler.acquire("key"))
+        await asyncio.sleep(0.01)
+        scheduler.stop()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.task is None
+    asyncio.run(main())
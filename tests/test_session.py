@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import discord
+
+from src import session as session_module
+from src.session import MudSession, SessionManager
+
+
+class FakeClient:
+    is_shutting_down = False
+
+    def log_event(self, user_id, username, message):
+        pass
+
+
+class FakeMessage:
+    def __init__(self, id, content, fail_edit=False):
+        self.id = id
+        self.content = content
+        self.fail_edit = fail_edit
+
+    async def edit(self, content):
+        if self.fail_edit:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        self.content = content
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+        self.last_message_id = None
+
+    async def send(self, content, file=None):
+        message = FakeMessage(len(self.sent) + 1, content)
+        self.sent.append((content, file))
+        self.last_message_id = message.id
+        return message
+
+
+def make_session(channel):
+    manager = SessionManager(FakeClient())
+    return MudSession(manager, 1, None, None, channel, "tester")
+
+
+def test_failed_edit_posts_a_new_message(monkeypatch):
+    monkeypatch.setattr(session_module, "EDIT_APPEND", True)
+
+    async def main():
+        channel = FakeChannel()
+        session = make_session(channel)
+        deleted = FakeMessage(99, "old", fail_edit=True)
+        session.last_message = deleted
+        session.last_message_body = "old"
+        session.last_message_time = asyncio.get_running_loop().time()
+        channel.last_message_id = deleted.id
+
+        session.buffer.append("new output\n")
+        await session.msg_queue.put(True)
+        for _ in range(100):
+            if channel.sent:
+                break
+            await asyncio.sleep(0.01)
+        session.stop()
+        session.manager.stop()
+        return channel, session
+
+    channel, session = asyncio.run(main())
+    assert len(channel.sent) == 1
+    assert "new output" in channel.sent[0][0]
+    assert "old" not in channel.sent[0][0]
+    assert session.last_message is not None and session.last_message.id == 1
+    assert not session.buffer
+
+
+def spill(text, mention=""):
+    async def main():
+        channel = FakeChannel()
+        session = make_session(channel)
+        session.buffer.append(text)
+        await session.spill_buffer(mention)
+        session.stop()
+        session.manager.stop()
+        return channel, session
+    return asyncio.run(main())
+
+
+def test_spill_keeps_message_under_limit_and_posts_extra_links():
+    urls = [f"https://example.com/{i:03d}/{'p' * 96}" for i in range(40)]
+    lines = [f"{urls[i]} {urls[i + 1]} end" for i in range(0, 40, 2)]
+    channel, session = spill("x" * 10000 + "\n" + "\n".join(lines) + "\n", mention=" <@1> 🔔")
+    content, file = channel.sent[0]
+    assert file is not None
+    assert content.startswith("📄")
+    assert len(content) <= 2000
+    # Every link in the inline tail is posted, some of them in a follow-up
+    posted = "".join(message for message, _ in channel.sent)
+    assert len(channel.sent) > 1
+    assert posted.count("🔗") == 8
+    assert not session.buffer
+
+
+def test_spill_tail_without_newlines_starts_outside_escapes():
+    text = "\x1b[1;31mred\x1b[0m " * 1000
+    channel, _ = spill(text)
+    body = channel.sent[0][0].split("```ansi\n", 1)[1]
+    assert body.startswith("\x1b[")
+    assert len(body) < 1100
+
+
+def test_backlogged_sessions_get_a_smaller_send_share():
+    async def main():
+        session = make_session(FakeChannel())
+        weights = []
+        session.buffer.append("short\n")
+        await session.acquire_send()
+        weights.append(session.manager.scheduler.weights[1])
+        session.buffer.append("x" * session_module.FLUSH_SIZE)
+        await session.acquire_send()
+        weights.append(session.manager.scheduler.weights[1])
+        session.stop()
+        session.manager.stop()
+        return weights
+    assert asyncio.run(main()) == [session_module.INTERACTIVE_SEND_WEIGHT, 1]
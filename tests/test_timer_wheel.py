@@ -0,0 +1,58 @@
+import asyncio
+
+from src.timer_wheel import TimerWheel
+
+
+def run_wheel(schedule, duration, tick=0.01, slots=8):
+    expired = []
+    async def main():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        wheel = TimerWheel(tick, slots, lambda item: expired.append((item, loop.time() - start)))
+        schedule(wheel)
+        await asyncio.sleep(duration)
+        wheel.stop()
+        return wheel
+    wheel = asyncio.run(main())
+    return wheel, expired
+
+
+def test_items_expire_in_order():
+    def schedule(wheel):
+        wheel.schedule("late", 0.05)
+        wheel.schedule("early", 0.02)
+    wheel, expired = run_wheel(schedule, 0.15)
+    assert [item for item, _ in expired] == ["early", "late"]
+    assert expired[0][1] >= 0.02
+    assert len(wheel) == 0
+
+
+def test_cancel_and_reschedule():
+    def schedule(wheel):
+        wheel.schedule("cancelled", 0.02)
+        wheel.cancel("cancelled")
+        wheel.schedule("moved", 0.02)
+        wheel.schedule("moved", 0.05)
+    wheel, expired = run_wheel(schedule, 0.15)
+    assert [item for item, _ in expired] == ["moved"]
+    assert expired[0][1] >= 0.05
+
+
+def test_long_delays_are_capped_to_one_turn():
+    wheel, expired = run_wheel(lambda wheel: wheel.schedule("far", 10.0), 0.2, slots=4)
+    # Lands in the last slot; on_expire is expected to reschedule it
+    assert [item for item, _ in expired] == ["far"]
+
+
+def test_stop_allows_restart():
+    expired = []
+    async def main():
+        wheel = TimerWheel(0.01, 8, expired.append)
+        wheel.schedule("first", 0.01)
+        wheel.stop()
+        assert wheel.task is None
+        wheel.schedule("second", 0.01)
+        await asyncio.sleep(0.1)
+        wheel.stop()
+    asyncio.run(main())
+    assert expired == ["second"]
@@ -0,0 +1,71 @@
+from src import triggers
+from src.triggers import AhoCorasick, Trigger, TriggerEngine, HIGHLIGHT_SEQUENCE
+
+
+def make_engine(*trigger_list):
+    engine = TriggerEngine()
+    for trigger in trigger_list:
+        engine.add(trigger)
+    return engine
+
+
+def test_aho_corasick_finds_overlapping_patterns():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    assert automaton.search("ushers") == {0, 1, 3}
+
+
+def test_literal_and_regex_matching():
+    engine = make_engine(Trigger("rat", 'gag'), Trigger(r"^\d+ gold", 'highlight', is_regex=True))
+    assert [t.pattern for t in engine.match("A RAT arrives.")] == ["rat"]
+    assert [t.action for t in engine.match("12 gold coins")] == ['highlight']
+    assert engine.match("nothing here") == []
+
+
+def test_gag_waits_for_line_split_across_reads():
+    engine = make_engine(Trigger("gossip", 'gag'))
+    first, _ = engine.process("Hello\n[gossip] Bob: hel")
+    second, _ = engine.process("lo there\nNext line\n")
+    assert first + second == "Hello\nNext line\n"
+
+
+def test_highlight_covers_line_split_across_reads():
+    engine = make_engine(Trigger("treasure", 'highlight'))
+    first, _ = engine.process("You see trea")
+    second, _ = engine.process("sure.\n")
+    assert first == ""
+    assert second == f"{HIGHLIGHT_SEQUENCE}You see treasure.\x1b[0m\n"
+
+
+def test_prompt_is_released_and_matched():
+    engine = make_engine(Trigger("gossip", 'gag'))
+    text, _ = engine.process("HP:100> ", at_prompt=True)
+    assert text == "HP:100> "
+    assert not engine.holding
+
+
+def test_flush_releases_held_line():
+    engine = make_engine(Trigger("gossip", 'gag'))
+    assert engine.process("Enter your name: ") == ("", [])
+    assert engine.holding
+    assert engine.flush() == ("Enter your name: ", [])
+    assert engine.flush() == ("", [])
+
+
+def test_send_only_triggers_pass_partial_lines_through():
+    engine = make_engine(Trigger("hungry", 'send', command="eat bread"))
+    assert engine.process("You are hun") == ("You are hun", [])
+    assert engine.process("gry.\n") == ("gry.\n", ["eat bread"])
+
+
+def test_send_trigger_ignores_its_own_echo():
+    engine = make_engine(Trigger("bread", 'send', command="eat bread"))
+    assert engine.process("eat bread\n") == ("eat bread\n", [])
+
+
+def test_send_trigger_does_not_refire_immediately(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(triggers.time, "monotonic", lambda: now[0])
+    engine = make_engine(Trigger("hungry", 'send', command="eat"))
+    assert engine.process("You are hungry.\nYou are hungry.\n")[1] == ["eat"]
+    now[0] += 5
+    assert engine.process("You are hungry.\n")[1] == ["eat"]
@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from src import upload
+from src.upload import Upload, iter_line_batches
+
+
+class FakeProtocol:
+    def __init__(self, close_after=None):
+        self.sent = []
+        self.write_closed = False
+        self.close_after = close_after
+
+    async def send_text(self, text):
+        self.sent.append(text)
+        if self.close_after is not None and len(self.sent) >= self.close_after:
+            self.write_closed = True
+
+
+def make_upload(protocol, lines_per_second=0):
+    session = SimpleNamespace(protocol=protocol, input_lock=asyncio.Lock())
+    return Upload(session, SimpleNamespace(url="http://example.invalid/file.txt"), lines_per_second)
+
+
+async def no_progress(lines_sent):
+    pass
+
+
+def test_iter_line_batches_streams_lines():
+    async def main():
+        async def handler(request):
+            return web.Response(body=b"north\r\nsouth\n" + b"x" * 5000 + b"\nlast")
+        app = web.Application()
+        app.router.add_get("/file.txt", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            return [line async for batch in iter_line_batches(f"http://127.0.0.1:{port}/file.txt") for line in batch]
+        finally:
+            await runner.cleanup()
+    lines = asyncio.run(main())
+    assert lines[:2] == ["north", "south"]
+    assert "".join(lines[2:-1]) == "x" * 5000
+    assert max(len(line) for line in lines) <= upload.UPLOAD_MAX_LINE
+    assert lines[-1] == "last"
+
+
+def test_run_closes_batches_when_the_session_closes(monkeypatch):
+    closed = []
+    async def fake_batches(url):
+        try:
+            for i in range(10):
+                yield [f"line {i}"]
+        finally:
+            closed.append(True)
+    monkeypatch.setattr(upload, "iter_line_batches", fake_batches)
+
+    protocol = FakeProtocol(close_after=2)
+    job = make_upload(protocol)
+    asyncio.run(job.run(no_progress))
+    assert protocol.sent == ["line 0\n", "line 1\n"]
+    assert closed == [True]
+
+
+def test_run_holds_the_input_lock_for_each_batch(monkeypatch):
+    async def fake_batches(url):
+        yield ["a", "b"]
+    monkeypatch.setattr(upload, "iter_line_batches", fake_batches)
+
+    async def main():
+        protocol = FakeProtocol()
+        job = make_upload(protocol)
+        async with job.session.input_lock:
+            task = asyncio.create_task(job.run(no_progress))
+            await asyncio.sleep(0.01)
+            # Typed input holds the lock, so the upload hasn't sent anything yet
+            assert protocol.sent == []
+        await task
+        return protocol, job
+    protocol, job = asyncio.run(main())
+    assert protocol.sent == ["a\nb\n"]
+    assert job.lines_sent == 2